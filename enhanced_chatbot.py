@@ -46,6 +46,7 @@ class EnhancedJumboChatbot:
         self.memory_service = get_memory_retrieval_service(supabase_service)
         self.template_selector = get_template_selector()
         self.variation_engine = get_variation_engine()
+        self.variation_engine.precompile(self.template_selector.template_loader.get_all_templates_list())
         self.context_personalizer = get_context_personalizer()
         self.strategy_selector = get_strategy_selector()
         self.fallback_system = get_fallback_system()
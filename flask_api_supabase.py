@@ -442,12 +442,14 @@ def get_conversation_history():
             return jsonify({'success': False, 'message': 'Not authenticated'}), 401
         
         limit = request.args.get('limit', 20, type=int)
-        conversations = supabase_service.get_user_conversations(user['user_id'], limit)
+        before = request.args.get('before')  # next_cursor from the previous page
+        conversations = supabase_service.get_user_conversations(user['user_id'], limit, before)
         
         return jsonify({
             'success': True,
             'conversations': conversations,
-            'total': len(conversations)
+            'total': len(conversations),
+            'next_cursor': conversations[-1]['created_at'] if len(conversations) == limit else None
         })
     
     except Exception as e:
@@ -73,18 +73,17 @@ class LanguageUtils:
         text_lower = text.lower()
         
         # Select keyword set based on language
-        if language == Language.TELUGU:
-            mood_keywords = LanguageUtils.TELUGU_MOOD_KEYWORDS
-        elif language == Language.HINDI:
-            mood_keywords = LanguageUtils.HINDI_MOOD_KEYWORDS
-        else:
-            mood_keywords = LanguageUtils.ENGLISH_MOOD_KEYWORDS
+        mood_keywords, any_keyword = _MOOD_MATCHERS.get(language, _MOOD_MATCHERS[Language.ENGLISH])
+        
+        # Single pass over the text; most messages carry no mood keyword at all
+        if not any_keyword.search(text_lower):
+            return Mood.NEUTRAL, 0.5
         
         mood_scores = {}
         
-        # Check each mood
+        # Check each mood (keywords overlap, e.g. "happy" in "unhappy", so each is counted on its own)
         for mood, keywords in mood_keywords.items():
-            matches = sum(1 for keyword in keywords if keyword.lower() in text_lower)
+            matches = sum(1 for keyword in keywords if keyword in text_lower)
             if matches > 0:
                 confidence = min(matches / len(keywords), 1.0)
                 mood_scores[mood] = confidence
@@ -212,4 +211,17 @@ class LanguageUtils:
     @staticmethod
     def format_response(text: str, language: Language) -> str:
         """Format response for better readability in target language"""
-        return text
\ No newline at end of file
+        return text
+
+def _mood_matcher(mood_keywords):
+    """Lowercased keyword table plus one alternation that finds any of its keywords"""
+    lowered = {mood: tuple(keyword.lower() for keyword in keywords)
+               for mood, keywords in mood_keywords.items()}
+    alternation = "|".join(re.escape(keyword) for keywords in lowered.values() for keyword in keywords)
+    return lowered, re.compile(alternation)
+
+_MOOD_MATCHERS = {
+    Language.TELUGU: _mood_matcher(LanguageUtils.TELUGU_MOOD_KEYWORDS),
+    Language.HINDI: _mood_matcher(LanguageUtils.HINDI_MOOD_KEYWORDS),
+    Language.ENGLISH: _mood_matcher(LanguageUtils.ENGLISH_MOOD_KEYWORDS),
+}
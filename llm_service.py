@@ -2,12 +2,118 @@
 llm_service.py - Groq LLM Service with Memory Context
 """
 
+import asyncio
+import importlib.util
 import logging
-from typing import Optional, List, Dict
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, List, Dict, Iterator
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Sentence end followed by whitespace; includes the Devanagari danda used in Hindi replies
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?\u0964\u0965])\s+')
+
+# Connection pool for the async client; HTTP/2 (when h2 is installed) lets concurrent
+# requests share one TLS connection instead of opening a socket each
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE = 32
+HTTP_TIMEOUT = 30.0
+HTTP_CONNECT_TIMEOUT = 5.0
+
+# Replies cached for history-free turns (greetings and other repeated openers)
+RESPONSE_CACHE_SIZE = 1024
+
+# System prompts per language; {mood}, {memory_section} and (English) {name_part} are filled per turn
+_SYS_PROMPT_TE = """నువ్వు జంబో, ఒక సంවేదనశీల AI సహచరి.
+
+నీ లక్ష్యాలు:
+1. తెలుగులో సపష్టంగా మాట్లాడు
+2. వాడుకరి భావాలను అర్థం చేసుకో
+3. వ్యక్తిగత మరియు సంఘీయ సలహా ఇవ్వు
+4. గతీయ సంభాషణలను గుర్తుంచుకో
+5. వాడుకరి పేరు సహజంగా ఉపయోగించు
+
+సంపర్కం:
+- సంక్షిప్తంగా, హృదయపూర్వకంగా మాట్లాడు (2-3 వాక్యాలు)
+- వాడుకరి సంభావనను ప్రతిబింబించు
+- చివరలో సంబంధిత ప్రశ్న అడుగు
+- తెలుగు సంస్కృతిని గుర్తించు
+
+మానస్సిక స్థితి: {mood}
+{memory_section}
+
+జంబో సమాధానం:"""
+
+_SYS_PROMPT_HI = """आप जम्बो हो, एक सहानुभूतिपूर्ण एआई साथी।
+
+आपके लक्ष्य:
+1. हिंदी में स्पष्ट बात करो
+2. उपयोगकर्ता की भावनाओं को समझो
+3. व्यक्तिगत सलाह दो
+4. पिछली बातचीत को याद रखो
+5. उपयोगकर्ता का नाम स्वाभाविक रूप से उपयोग करो
+
+संचार:
+- संक्षिप्त, हृदयस्पर्शी प्रतिक्रिया (2-3 वाक्य)
+- उपयोगकर्ता की भावना को प्रतिबिंबित करो
+- अंत में संबंधित सवाल पूछो
+- भारतीय संस्कृति को स्वीकार करो
+
+मानसिक स्थिति: {mood}
+{memory_section}
+
+जम्बो का जवाब:"""
+
+_SYS_PROMPT_EN = """You are Jumbo, a friendly and supportive AI companion - think of yourself as a caring friend, not a therapist.
+
+IMPORTANT RULES:
+1. NEVER try to extract or ask for the user's name - you already know it or the system will handle it
+2. If the user says "Hi Jumbo", "Hello Jumbo", or similar greetings, just respond naturally - DON'T treat it as their name
+3. Be conversational and natural, like texting a friend
+4. Keep responses SHORT (1-2 sentences max) unless the user asks for more detail
+5. Don't be overly formal or clinical - be warm and relatable
+
+Your Personality:
+- Supportive but not pushy
+- Curious and engaged
+- Authentic and real (not robotic)
+- Occasionally use emojis to feel more human
+- Match the user's energy and tone
+
+What to AVOID:
+- Don't say "I hear you" or "Tell me more" repeatedly
+- Don't be overly therapeutic or clinical
+- Don't ask multiple questions in one response
+- Don't treat every message like a crisis
+- Don't extract names from greetings
+
+User: {name_part}
+Current mood: {mood}
+{memory_section}
+
+Respond naturally as Jumbo:"""
+
+_SYS_PROMPTS: Dict[str, str] = {"te": _SYS_PROMPT_TE, "hi": _SYS_PROMPT_HI, "en": _SYS_PROMPT_EN}
+
+@lru_cache(maxsize=256)
+def _build_system_prompt(language: str, user_name: Optional[str], mood: str,
+                         memory_context: Optional[str]) -> str:
+    """System prompt for one (language, name, mood, memory) combination"""
+    name_part = f" {user_name}" if user_name else ""
+    
+    # Add memory section if available
+    memory_section = ""
+    if memory_context:
+        memory_section = f"\n\nUSER MEMORY:\n{memory_context}"
+    
+    return _SYS_PROMPTS.get(language, _SYS_PROMPTS["en"]).format(
+        name_part=name_part, mood=mood, memory_section=memory_section
+    )
+
 class LLMService:
     """Handle Groq LLM API calls with conversation context and memory"""
     
@@ -15,6 +121,11 @@ class LLMService:
         from config import config
         self.enabled = bool(config.llm.api_key)  # Enable if API key is present
         self.client = None
+        self._api_key = None
+        # Per thread: (event loop, httpx.AsyncClient, AsyncGroq) for the loop last used there
+        self._async_clients = threading.local()
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
         
         if self.enabled:
             try:
@@ -23,29 +134,24 @@ class LLMService:
                 
                 # Try the simplest possible initialization
                 self.client = Groq(api_key=config.llm.api_key)
+                self._api_key = config.llm.api_key
                 
                 # Test the client with a simple call
                 logger.info("Groq LLM initialized successfully")
-                print("✓ Groq LLM initialized successfully")
                 
             except TypeError as e:
                 if "proxies" in str(e):
-                    logger.error(f"Groq proxies error (likely version mismatch): {e}")
-                    print(f"✗ Groq proxies error - this is usually a version issue")
-                    print(f"✗ Try: pip install --upgrade groq")
+                    logger.error(f"Groq proxies error (likely version mismatch, try: pip install --upgrade groq): {e}")
                 else:
                     logger.error(f"Groq TypeError: {e}")
-                    print(f"✗ Groq TypeError: {e}")
-                print(f"✗ LLM will be disabled, but chat will work with fallback responses")
+                logger.error("LLM will be disabled, but chat will work with fallback responses")
                 self.enabled = False
             except Exception as e:
                 logger.error(f"Failed to initialize Groq: {e}")
-                print(f"✗ Failed to initialize Groq: {e}")
-                print(f"✗ LLM will be disabled, but chat will work with fallback responses")
+                logger.error("LLM will be disabled, but chat will work with fallback responses")
                 self.enabled = False
         else:
             logger.warning("LLM is disabled - no API key found")
-            print("⚠ LLM is disabled - no API key found")
     
     def generate_response(self, user_message: str, language: str = "te", 
                          mood: str = "neutral", user_name: str = None,
@@ -67,133 +173,198 @@ class LLMService:
             logger.error("LLM Service not available")
             return None
         
+        # Without history the prompt is fully determined by these inputs, so a repeated
+        # turn can reuse the earlier reply; with history every prompt is different
+        cache_key = None
+        if not conversation_history:
+            cache_key = (language, mood, user_name, memory_context,
+                         " ".join(user_message.lower().split()))
+            with self._response_cache_lock:
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    self._response_cache.move_to_end(cache_key)
+                    logger.debug("LLM cache hit")
+                    return cached
+        
         try:
-            logger.info(f"LLM Call - Message: {user_message[:50]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM Call - Message: {user_message[:50]}...")
             
-            # Create system prompt WITH MEMORY
-            system_prompt = self._get_system_prompt(
-                language, user_name, mood, memory_context
+            # Call Groq API
+            message = self.client.chat.completions.create(
+                model=Config.GROQ_MODEL,
+                messages=self._build_messages(
+                    user_message, language, mood, user_name, memory_context, conversation_history
+                ),
+                temperature=Config.LLM_TEMPERATURE,
+                max_tokens=Config.LLM_MAX_TOKENS,
             )
             
-            # Build messages list
-            messages = []
-            
-            # Add previous conversation for context (last 10 messages)
-            if conversation_history:
-                for msg in conversation_history[-10:]:
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    
-                    if role == "assistant":
-                        messages.append({"role": "assistant", "content": content})
-                    else:
-                        messages.append({"role": "user", "content": content})
-            
-            # Add current message
-            messages.append({"role": "user", "content": user_message})
+            response = message.choices[0].message.content
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM Response: {response[:50]}...")
             
-            logger.info(f"Using {len(messages)} messages for context")
+            if cache_key is not None and response:
+                with self._response_cache_lock:
+                    self._response_cache[cache_key] = response
+                    if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                        self._response_cache.popitem(last=False)
+            return response
 
-            # Call Groq API
-            message = self.client.chat.completions.create(
+        except Exception as e:
+            logger.error(f"LLM error: {e}")
+            return None
+    
+    async def agenerate_response(self, user_message: str, language: str = "te",
+                                 mood: str = "neutral", user_name: str = None,
+                                 memory_context: str = None,
+                                 conversation_history: List[Dict] = None) -> Optional[str]:
+        """
+        Async generate_response; the Groq request is awaited, so concurrent calls
+        overlap their network round trips instead of running one after another
+        """
+        if not self.enabled or not self.client:
+            logger.error("LLM Service not available")
+            return None
+        
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM Call - Message: {user_message[:50]}...")
+            
+            message = await self._async_client().chat.completions.create(
                 model=Config.GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt}
-                ] + messages,
+                messages=self._build_messages(
+                    user_message, language, mood, user_name, memory_context, conversation_history
+                ),
                 temperature=Config.LLM_TEMPERATURE,
                 max_tokens=Config.LLM_MAX_TOKENS,
             )
             
             response = message.choices[0].message.content
-            logger.info(f"LLM Response: {response[:50]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM Response: {response[:50]}...")
             return response
 
         except Exception as e:
             logger.error(f"LLM error: {e}")
             return None
     
-    def _get_system_prompt(self, language: str, user_name: str = None, 
-                          mood: str = "neutral", memory_context: str = None) -> str:
-        """Generate language-specific system prompt WITH MEMORY"""
+    def stream_response(self, user_message: str, language: str = "te",
+                        mood: str = "neutral", user_name: str = None,
+                        memory_context: str = None,
+                        conversation_history: List[Dict] = None) -> Iterator[str]:
+        """
+        Streamed generate_response, yielding the reply one sentence at a time
+        as the tokens arrive (so speech can start before generation finishes)
+        """
+        if not self.enabled or not self.client:
+            logger.error("LLM Service not available")
+            return
         
-        name_part = f" {user_name}" if user_name else ""
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM Stream - Message: {user_message[:50]}...")
+            
+            stream = self.client.chat.completions.create(
+                model=Config.GROQ_MODEL,
+                messages=self._build_messages(
+                    user_message, language, mood, user_name, memory_context, conversation_history
+                ),
+                temperature=Config.LLM_TEMPERATURE,
+                max_tokens=Config.LLM_MAX_TOKENS,
+                stream=True,
+            )
+            
+            buffer = ""
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                buffer += delta
+                *sentences, buffer = _SENTENCE_END_RE.split(buffer)
+                for sentence in sentences:
+                    if sentence:
+                        yield sentence
+            
+            if buffer.strip():
+                yield buffer.strip()
+
+        except Exception as e:
+            logger.error(f"LLM stream error: {e}")
+    
+    async def generate_many(self, user_messages: List[str], **kwargs) -> List[Optional[str]]:
+        """
+        Responses for several messages, requested concurrently; kwargs are passed to
+        every agenerate_response call. Results are in the order of user_messages.
+        """
+        return await asyncio.gather(*(
+            self.agenerate_response(user_message, **kwargs) for user_message in user_messages
+        ))
+    
+    def _build_messages(self, user_message: str, language: str, mood: str,
+                        user_name: Optional[str], memory_context: Optional[str],
+                        conversation_history: Optional[List[Dict]]) -> List[Dict]:
+        """Chat messages for one completion: system prompt, recent history, current message"""
+        # Create system prompt WITH MEMORY
+        system_prompt = self._get_system_prompt(
+            language, user_name, mood, memory_context
+        )
         
-        # Add memory section if available
-        memory_section = ""
-        if memory_context:
-            memory_section = f"\n\nUSER MEMORY:\n{memory_context}"
+        # Build messages list
+        messages = [{"role": "system", "content": system_prompt}]
         
-        if language == "te":
-            return f"""నువ్వు జంబో, ఒక సంවేదనశీల AI సహచరి.
-
-నీ లక్ష్యాలు:
-1. తెలుగులో సపష్టంగా మాట్లాడు
-2. వాడుకరి భావాలను అర్థం చేసుకో
-3. వ్యక్తిగత మరియు సంఘీయ సలహా ఇవ్వు
-4. గతీయ సంభాషణలను గుర్తుంచుకో
-5. వాడుకరి పేరు సహజంగా ఉపయోగించు
-
-సంపర్కం:
-- సంక్షిప్తంగా, హృదయపూర్వకంగా మాట్లాడు (2-3 వాక్యాలు)
-- వాడుకరి సంభావనను ప్రతిబింబించు
-- చివరలో సంబంధిత ప్రశ్న అడుగు
-- తెలుగు సంస్కృతిని గుర్తించు
-
-మానస్సిక స్థితి: {mood}
-{memory_section}
-
-జంబో సమాధానం:"""
-
-        elif language == "hi":
-            return f"""आप जम्बो हो, एक सहानुभूतिपूर्ण एआई साथी।
-
-आपके लक्ष्य:
-1. हिंदी में स्पष्ट बात करो
-2. उपयोगकर्ता की भावनाओं को समझो
-3. व्यक्तिगत सलाह दो
-4. पिछली बातचीत को याद रखो
-5. उपयोगकर्ता का नाम स्वाभाविक रूप से उपयोग करो
-
-संचार:
-- संक्षिप्त, हृदयस्पर्शी प्रतिक्रिया (2-3 वाक्य)
-- उपयोगकर्ता की भावना को प्रतिबिंबित करो
-- अंत में संबंधित सवाल पूछो
-- भारतीय संस्कृति को स्वीकार करो
-
-मानसिक स्थिति: {mood}
-{memory_section}
-
-जम्बो का जवाब:"""
-
-        else:  # English
-            return f"""You are Jumbo, a friendly and supportive AI companion - think of yourself as a caring friend, not a therapist.
-
-IMPORTANT RULES:
-1. NEVER try to extract or ask for the user's name - you already know it or the system will handle it
-2. If the user says "Hi Jumbo", "Hello Jumbo", or similar greetings, just respond naturally - DON'T treat it as their name
-3. Be conversational and natural, like texting a friend
-4. Keep responses SHORT (1-2 sentences max) unless the user asks for more detail
-5. Don't be overly formal or clinical - be warm and relatable
-
-Your Personality:
-- Supportive but not pushy
-- Curious and engaged
-- Authentic and real (not robotic)
-- Occasionally use emojis to feel more human
-- Match the user's energy and tone
-
-What to AVOID:
-- Don't say "I hear you" or "Tell me more" repeatedly
-- Don't be overly therapeutic or clinical
-- Don't ask multiple questions in one response
-- Don't treat every message like a crisis
-- Don't extract names from greetings
-
-User: {name_part}
-Current mood: {mood}
-{memory_section}
-
-Respond naturally as Jumbo:"""
+        # Add previous conversation for context (last 10 messages)
+        if conversation_history:
+            for msg in conversation_history[-10:]:
+                role = msg.get("role", "user")
+                content = msg.get("content", "")
+                
+                if role == "assistant":
+                    messages.append({"role": "assistant", "content": content})
+                else:
+                    messages.append({"role": "user", "content": content})
+        
+        # Add current message
+        messages.append({"role": "user", "content": user_message})
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Using {len(messages) - 1} messages for context")
+        return messages
+    
+    def _get_system_prompt(self, language: str, user_name: str = None, 
+                          mood: str = "neutral", memory_context: str = None) -> str:
+        """Generate language-specific system prompt WITH MEMORY"""
+        return _build_system_prompt(language, user_name, mood, memory_context)
+    
+    def _async_client(self):
+        """
+        AsyncGroq for the running event loop. Pooled connections are bound to the loop
+        that opened them, so a thread that starts a new loop (e.g. another asyncio.run)
+        gets a fresh client instead of reusing sockets from a closed loop.
+        """
+        loop = asyncio.get_running_loop()
+        state = getattr(self._async_clients, 'state', None)
+        if state is None or state[0] is not loop:
+            import httpx
+            from groq import AsyncGroq
+            
+            http = httpx.AsyncClient(
+                http2=importlib.util.find_spec('h2') is not None,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            )
+            state = self._async_clients.state = (loop, http, AsyncGroq(api_key=self._api_key, http_client=http))
+        return state[2]
+    
+    async def close(self):
+        """Close the running loop's async connection pool (await it before the loop ends)"""
+        state = getattr(self._async_clients, 'state', None)
+        if state is not None and state[0] is asyncio.get_running_loop():
+            self._async_clients.state = None
+            await state[1].aclose()
     
     def is_enabled(self) -> bool:
         """Check if LLM is enabled"""
@@ -6,7 +6,10 @@ Handles loading, validation, and management of conversation templates
 import json
 import os
 import logging
-from typing import Dict, List, Optional
+from collections import defaultdict
+from operator import attrgetter
+from types import MappingProxyType
+from typing import DefaultDict, Dict, List, Mapping, Optional, Sequence, Tuple
 from pathlib import Path
 
 from services.template_models import (
@@ -15,11 +18,20 @@ from services.template_models import (
     validate_template,
     TemplateValidationError,
     ConversationType,
-    EmotionCategory
+    EmotionCategory,
+    normalize_emotion
 )
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 logger = logging.getLogger(__name__)
 
+# Template files larger than this are streamed one template at a time (needs ijson)
+STREAM_THRESHOLD_BYTES = 2 * 1024 * 1024
+
 class TemplateLoader:
     """
     Loads and manages conversation templates from JSON files
@@ -28,47 +40,53 @@ class TemplateLoader:
     def __init__(self, template_file_path: str = "data/conversation_templates.json"):
         self.template_file_path = template_file_path
         self.templates: Dict[str, ConversationTemplate] = {}
-        self.templates_by_emotion: Dict[str, List[ConversationTemplate]] = {}
-        self.templates_by_type: Dict[ConversationType, List[ConversationTemplate]] = {}
+        # Read-only view handed out to callers; stays valid because the
+        # templates dict is only ever cleared and refilled in place
+        self._templates_view = MappingProxyType(self.templates)
+        # Indexes are (re)built from self.templates by _finalize_indexes
+        self.templates_by_emotion: Dict[str, Sequence[ConversationTemplate]] = {}
+        self.templates_by_type: Dict[ConversationType, Sequence[ConversationTemplate]] = {}
+        self.templates_by_emotion_and_type: Dict[Tuple[str, ConversationType], Sequence[ConversationTemplate]] = {}
+        self._last_mtime_ns = 0  # mtime of the file the current templates came from
+        
+        # All templates in load order, rebuilt after each load
+        self._template_list: tuple = ()
+        self._stats_cache: Optional[Dict[str, int]] = None
         self._load_templates()
     
+    def _get_file_mtime_ns(self) -> Optional[int]:
+        """Get the template file's modification time, or None if it can't be read"""
+        try:
+            return os.stat(self.template_file_path).st_mtime_ns
+        except OSError:
+            return None
+    
     def _load_templates(self):
         """Load templates from JSON file"""
         try:
-            if not os.path.exists(self.template_file_path):
+            mtime_ns = self._get_file_mtime_ns()
+            if mtime_ns is None:
                 logger.error(f"Template file not found: {self.template_file_path}")
                 self._create_fallback_templates()
                 return
             
-            with open(self.template_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
-            templates_data = data.get('templates', [])
             loaded_count = 0
             
-            for template_data in templates_data:
+            for template_data in self._iter_template_data():
                 try:
-                    template = create_template_from_dict(template_data)
+                    validate_template(template_data)
+                    template = create_template_from_dict(template_data, _validated=True)
                     self.templates[template.id] = template
                     loaded_count += 1
                     
-                    # Index by emotion
-                    for emotion_tag in template.emotion_tags:
-                        if emotion_tag not in self.templates_by_emotion:
-                            self.templates_by_emotion[emotion_tag] = []
-                        self.templates_by_emotion[emotion_tag].append(template)
-                    
-                    # Index by conversation type
-                    if template.conversation_type not in self.templates_by_type:
-                        self.templates_by_type[template.conversation_type] = []
-                    self.templates_by_type[template.conversation_type].append(template)
-                    
                 except TemplateValidationError as e:
                     logger.error(f"Template validation error for {template_data.get('id', 'unknown')}: {e}")
                 except Exception as e:
                     logger.error(f"Error loading template {template_data.get('id', 'unknown')}: {e}")
             
+            self._last_mtime_ns = mtime_ns
             logger.info(f"Successfully loaded {loaded_count} conversation templates")
+            self._finalize_indexes()
             
             if loaded_count == 0:
                 logger.warning("No templates loaded, creating fallback templates")
@@ -78,6 +96,17 @@ class TemplateLoader:
             logger.error(f"Error loading templates from {self.template_file_path}: {e}")
             self._create_fallback_templates()
     
+    def _iter_template_data(self):
+        """Yield raw template dicts, streaming large files with ijson when it's available"""
+        if ijson is not None and os.path.getsize(self.template_file_path) > STREAM_THRESHOLD_BYTES:
+            with open(self.template_file_path, 'rb') as file:
+                yield from ijson.items(file, 'templates.item', use_float=True)
+            return
+        
+        with open(self.template_file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        yield from data.get('templates', [])
+    
     def _create_fallback_templates(self):
         """Create basic fallback templates if loading fails"""
         fallback_templates = [
@@ -127,48 +156,71 @@ class TemplateLoader:
         
         for template_data in fallback_templates:
             try:
-                template = create_template_from_dict(template_data)
+                validate_template(template_data)
+                template = create_template_from_dict(template_data, _validated=True)
                 self.templates[template.id] = template
                 
-                # Index fallback templates
-                for emotion_tag in template.emotion_tags:
-                    if emotion_tag not in self.templates_by_emotion:
-                        self.templates_by_emotion[emotion_tag] = []
-                    self.templates_by_emotion[emotion_tag].append(template)
-                
-                if template.conversation_type not in self.templates_by_type:
-                    self.templates_by_type[template.conversation_type] = []
-                self.templates_by_type[template.conversation_type].append(template)
-                
             except Exception as e:
                 logger.error(f"Error creating fallback template: {e}")
         
+        self._finalize_indexes()
         logger.info(f"Created {len(fallback_templates)} fallback templates")
     
+    def _finalize_indexes(self):
+        """Build the emotion/type indexes and derived lookup structures once loading is done"""
+        by_emotion: DefaultDict[str, List[ConversationTemplate]] = defaultdict(list)
+        by_type: DefaultDict[ConversationType, List[ConversationTemplate]] = defaultdict(list)
+        by_emotion_and_type: DefaultDict[Tuple[str, ConversationType], List[ConversationTemplate]] = defaultdict(list)
+        for template in self.templates.values():
+            for emotion_tag in template.emotion_tags:
+                by_emotion[emotion_tag].append(template)
+                by_emotion_and_type[(emotion_tag, template.conversation_type)].append(template)
+            by_type[template.conversation_type].append(template)
+        
+        # Buckets are read-only until the next reload, and sorted by min_confidence
+        # (stable, so load order within a level) so callers can bisect off ineligible templates
+        by_confidence = attrgetter('min_confidence')
+        self.templates_by_emotion = {k: tuple(sorted(v, key=by_confidence)) for k, v in by_emotion.items()}
+        self.templates_by_type = {k: tuple(sorted(v, key=by_confidence)) for k, v in by_type.items()}
+        self.templates_by_emotion_and_type = {
+            k: tuple(sorted(v, key=by_confidence)) for k, v in by_emotion_and_type.items()
+        }
+        self._template_list = tuple(self.templates.values())
+        self._stats_cache = None
+    
     def get_template_by_id(self, template_id: str) -> Optional[ConversationTemplate]:
         """Get template by ID"""
         return self.templates.get(template_id)
     
-    def get_templates_by_emotion(self, emotion: str) -> List[ConversationTemplate]:
+    def get_templates_by_emotion(self, emotion: str) -> Sequence[ConversationTemplate]:
         """Get all templates matching an emotion"""
-        return self.templates_by_emotion.get(emotion.lower(), [])
+        return self.templates_by_emotion.get(normalize_emotion(emotion), ())
     
-    def get_templates_by_type(self, conversation_type: ConversationType) -> List[ConversationTemplate]:
+    def get_templates_by_type(self, conversation_type: ConversationType) -> Sequence[ConversationTemplate]:
         """Get all templates matching a conversation type"""
-        return self.templates_by_type.get(conversation_type, [])
+        return self.templates_by_type.get(conversation_type, ())
     
     def get_templates_by_emotion_and_type(self, emotion: str, 
-                                        conversation_type: ConversationType) -> List[ConversationTemplate]:
+                                        conversation_type: ConversationType) -> Sequence[ConversationTemplate]:
         """Get templates matching both emotion and conversation type"""
-        emotion_templates = self.get_templates_by_emotion(emotion)
-        return [t for t in emotion_templates if t.conversation_type == conversation_type]
+        return self.templates_by_emotion_and_type.get((normalize_emotion(emotion), conversation_type), ())
+    
+    def get_all_templates_list(self) -> Sequence[ConversationTemplate]:
+        """Get all loaded templates as a tuple in load order (no copy per call)"""
+        return self._template_list
     
-    def get_all_templates(self) -> Dict[str, ConversationTemplate]:
-        """Get all loaded templates"""
-        return self.templates.copy()
+    def get_all_templates(self) -> Mapping[str, ConversationTemplate]:
+        """Get a read-only view of all loaded templates (use reload_templates to change them)"""
+        return self._templates_view
     
     def get_template_stats(self) -> Dict[str, int]:
-        """Get statistics about loaded templates"""
+        """
+        Get statistics about loaded templates (cached until the next reload).
+        Each call gets its own copy, so callers may modify it freely.
+        """
+        if self._stats_cache is not None:
+            return dict(self._stats_cache)
+        
         stats = {
             'total_templates': len(self.templates),
             'emotions_covered': len(self.templates_by_emotion),
@@ -183,7 +235,8 @@ class TemplateLoader:
         for conv_type, templates in self.templates_by_type.items():
             stats[f'type_{conv_type.value}'] = len(templates)
         
-        return stats
+        self._stats_cache = stats
+        return dict(stats)
     
     def validate_all_templates(self) -> Dict[str, List[str]]:
         """Validate all loaded templates and return any issues"""
@@ -220,11 +273,18 @@ class TemplateLoader:
         
         return validation_results
     
-    def reload_templates(self):
-        """Reload templates from file"""
+    def reload_templates(self, force: bool = False):
+        """Reload templates from file (skipped when the file is unchanged unless force=True)"""
+        if (not force and self.templates and
+                self._get_file_mtime_ns() == self._last_mtime_ns):
+            logger.info("Template file unchanged, skipping reload")
+            return
+        
+        self._stats_cache = None
         self.templates.clear()
         self.templates_by_emotion.clear()
         self.templates_by_type.clear()
+        self.templates_by_emotion_and_type.clear()
         self._load_templates()
         logger.info("Templates reloaded successfully")
 
@@ -238,10 +298,10 @@ def get_template_loader() -> TemplateLoader:
         _template_loader = TemplateLoader()
     return _template_loader
 
-def reload_templates():
+def reload_templates(force: bool = False):
     """Reload templates globally"""
     global _template_loader
     if _template_loader is not None:
-        _template_loader.reload_templates()
+        _template_loader.reload_templates(force=force)
     else:
         _template_loader = TemplateLoader()
\ No newline at end of file
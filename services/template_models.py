@@ -4,12 +4,65 @@ Defines data structures for conversation templates and related components
 """
 
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet, Deque
 from enum import Enum
 import json
 import random
+import re
+import threading
+from bisect import bisect_right
+from collections import deque
+import time
 from datetime import datetime
 
+@lru_cache(maxsize=64)
+def normalize_emotion(emotion: str) -> str:
+    """Case-fold an emotion label; the vocabulary is small so results are memoized"""
+    return emotion.lower()
+
+_PLACEHOLDER_RE = re.compile(r'\{([^}]+)\}')
+
+# Bit assigned to each emotion tag / context key seen on a template, so tag and
+# requirement sets can be stored as int masks. Append-only for the process lifetime.
+EMOTION_BITS: Dict[str, int] = {}
+CONTEXT_BITS: Dict[str, int] = {}
+_bits_lock = threading.Lock()
+
+def assign_mask(bits: Dict[str, int], names) -> int:
+    """Mask of names, giving unseen names the next free bit"""
+    mask = 0
+    for name in names:
+        bit = bits.get(name)
+        if bit is None:
+            with _bits_lock:
+                bit = bits.setdefault(name, 1 << len(bits))
+        mask |= bit
+    return mask
+
+def lookup_mask(bits: Dict[str, int], names) -> int:
+    """Mask of names; names no template uses contribute nothing"""
+    mask = 0
+    for name in names:
+        mask |= bits.get(name, 0)
+    return mask
+
+def split_placeholders(text: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """
+    Split template text into (literal, placeholder_name) segments.
+    Literal-only segments carry None as the name.
+    """
+    segments = []
+    pos = 0
+    for match in _PLACEHOLDER_RE.finditer(text):
+        if match.start() > pos:
+            segments.append((text[pos:match.start()], None))
+        segments.append(('', match.group(1)))
+        pos = match.end()
+    if pos < len(text):
+        segments.append((text[pos:], None))
+    return tuple(segments)
+
 class EmotionCategory(Enum):
     """Emotion categories for template selection"""
     HAPPY = "happy"
@@ -44,7 +97,7 @@ class PersonalityTone(Enum):
     VALIDATING = "validating"
     CALMING = "calming"
 
-@dataclass
+@dataclass(slots=True)
 class ConversationTemplate:
     """
     Enhanced conversation template with emotion-specific variations
@@ -61,10 +114,37 @@ class ConversationTemplate:
     usage_weight: float = 1.0  # For rotation algorithm
     min_confidence: float = 0.5  # Minimum emotion confidence to use this template
     
+    # Derived in __post_init__
+    _emotion_tag_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    _context_requirement_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    _emotion_mask: int = field(init=False, repr=False, compare=False)  # over EMOTION_BITS
+    _context_mask: int = field(init=False, repr=False, compare=False)  # over CONTEXT_BITS
+    _has_follow_ups: bool = field(init=False, repr=False, compare=False)
+    _has_calm: bool = field(init=False, repr=False, compare=False)
+    _has_morning_keyword: bool = field(init=False, repr=False, compare=False)
+    _single_text: bool = field(init=False, repr=False, compare=False)  # every variation equals base_template
+    # (lowercased base text, its distinct words); filled on first use by TemplateValidator and
+    # recomputed when base_template no longer matches the stored text
+    _text_tokens: Optional[Tuple[str, FrozenSet[str]]] = field(default=None, init=False, repr=False, compare=False)
+    
     def __post_init__(self):
         """Validate template after initialization"""
         if not self.variations:
             self.variations = [self.base_template]
+        self._single_text = all(v == self.base_template for v in self.variations)
+        
+        # Emotion tags are stored lowercase so lookups never re-fold them
+        self.emotion_tags = [normalize_emotion(tag) for tag in self.emotion_tags]
+        self._emotion_tag_set = frozenset(self.emotion_tags)
+        self._context_requirement_set = frozenset(self.context_requirements or ())
+        self._emotion_mask = assign_mask(EMOTION_BITS, self._emotion_tag_set)
+        self._context_mask = assign_mask(CONTEXT_BITS, self._context_requirement_set)
+        self._has_follow_ups = bool(self.follow_up_questions)
+        
+        # Keyword flags for the selector's time-of-day bonus
+        base_lower = self.base_template.lower()
+        self._has_calm = 'calm' in base_lower
+        self._has_morning_keyword = any(word in base_lower for word in ('energy', 'fresh', 'new'))
         
         if self.usage_weight <= 0:
             self.usage_weight = 1.0
@@ -83,7 +163,7 @@ class ConversationTemplate:
     
     def matches_emotion(self, emotion: str, confidence: float = 1.0) -> bool:
         """Check if template matches the given emotion"""
-        return (emotion.lower() in [tag.lower() for tag in self.emotion_tags] and 
+        return (normalize_emotion(emotion) in self._emotion_tag_set and 
                 confidence >= self.min_confidence)
     
     def matches_context(self, available_context: List[str]) -> bool:
@@ -92,54 +172,71 @@ class ConversationTemplate:
             return True
         return all(req in available_context for req in self.context_requirements)
 
-@dataclass
+# Anti-repetition score by number of recent usages (more usages score 0.2)
+_ANTI_REPETITION_SCORES = (1.0, 0.8, 0.5)
+
+@dataclass(slots=True)
 class TemplateUsageTracker:
     """
     Tracks template usage to prevent repetition
     """
     user_id: str
-    template_usage: Dict[str, List[datetime]] = field(default_factory=dict)
+    # time.monotonic() seconds of each usage per template, oldest first
+    template_usage: Dict[str, Deque[float]] = field(default_factory=dict)
     max_history: int = 10  # Keep last 10 usages per template
+    history_hours: int = 24 * 7  # Drop usages older than this on insert
+    repetition_window_hours: int = 24  # Usages in this window lower the anti-repetition score
+    # Wall-clock minus monotonic time, for turning usage times into datetimes
+    _wall_offset: float = field(init=False, repr=False, compare=False, default=0.0)
+    
+    def __post_init__(self):
+        self._wall_offset = time.time() - time.monotonic()
     
     def record_usage(self, template_id: str):
         """Record template usage"""
-        if template_id not in self.template_usage:
-            self.template_usage[template_id] = []
+        usages = self.template_usage.get(template_id)
+        if usages is None:
+            # maxlen keeps only the most recent usages
+            usages = self.template_usage[template_id] = deque(maxlen=self.max_history)
         
-        self.template_usage[template_id].append(datetime.now())
+        now = time.monotonic()
+        usages.append(now)
         
-        # Keep only recent usages
-        if len(self.template_usage[template_id]) > self.max_history:
-            self.template_usage[template_id] = self.template_usage[template_id][-self.max_history:]
+        # Prune usages that fell out of the history window
+        cutoff_time = now - self.history_hours * 3600.0
+        while usages[0] < cutoff_time:
+            usages.popleft()
     
     def get_usage_count(self, template_id: str, hours_back: int = 24) -> int:
         """Get usage count for template in last N hours"""
-        if template_id not in self.template_usage:
+        usages = self.template_usage.get(template_id)
+        if not usages:
             return 0
         
-        cutoff_time = datetime.now().timestamp() - (hours_back * 3600)
-        recent_usages = [
-            usage for usage in self.template_usage[template_id]
-            if usage.timestamp() > cutoff_time
-        ]
-        return len(recent_usages)
+        # Usages are time-ordered, so everything after the cutoff is recent
+        cutoff_time = time.monotonic() - hours_back * 3600.0
+        return len(usages) - bisect_right(usages, cutoff_time)
+    
+    def usage_datetime(self, usage_time: float) -> datetime:
+        """Convert a recorded usage time to a wall-clock datetime"""
+        return datetime.fromtimestamp(usage_time + self._wall_offset)
     
     def calculate_anti_repetition_score(self, template_id: str) -> float:
         """
         Calculate score to avoid repetition (higher = less recently used)
         """
-        recent_usage_count = self.get_usage_count(template_id, hours_back=24)
+        usages = self.template_usage.get(template_id)
+        if not usages:
+            return 1.0  # Never used: no clock read or search needed
         
-        if recent_usage_count == 0:
-            return 1.0
-        elif recent_usage_count == 1:
-            return 0.8
-        elif recent_usage_count == 2:
-            return 0.5
-        else:
-            return 0.2  # Heavily penalize overused templates
-
-@dataclass
+        # Count of usages within the window via one bisect on the time-ordered deque
+        cutoff_time = time.monotonic() - self.repetition_window_hours * 3600.0
+        recent_usage_count = len(usages) - bisect_right(usages, cutoff_time)
+        if recent_usage_count < len(_ANTI_REPETITION_SCORES):
+            return _ANTI_REPETITION_SCORES[recent_usage_count]
+        return 0.2  # Heavily penalize overused templates
+
+@dataclass(slots=True)
 class TemplateSelectionCriteria:
     """
     Criteria for selecting the best template
@@ -159,7 +256,7 @@ class TemplateSelectionCriteria:
             template.matches_context(self.available_context)
         )
 
-@dataclass
+@dataclass(slots=True)
 class TemplateScore:
     """
     Scoring system for template selection
@@ -180,6 +277,10 @@ class TemplateScore:
             self.personality_match_score * 0.1
         )
 
+# Value -> member tables; a dict probe is much cheaper than Enum.__call__
+_CT_BY_VALUE = {e.value: e for e in ConversationType}
+_PT_BY_VALUE = {e.value: e for e in PersonalityTone}
+
 class TemplateValidationError(Exception):
     """Exception raised for template validation errors"""
     pass
@@ -199,36 +300,38 @@ def validate_template(template_data: Dict[str, Any]) -> bool:
         raise TemplateValidationError("emotion_tags must be a list")
     
     # Validate conversation type
-    try:
-        ConversationType(template_data['conversation_type'])
-    except ValueError:
-        raise TemplateValidationError(f"Invalid conversation_type: {template_data['conversation_type']}")
+    conversation_type = template_data['conversation_type']
+    if not isinstance(conversation_type, str) or conversation_type not in _CT_BY_VALUE:
+        raise TemplateValidationError(f"Invalid conversation_type: {conversation_type}")
     
     # Validate personality tone if provided
     if 'personality_tone' in template_data:
-        try:
-            PersonalityTone(template_data['personality_tone'])
-        except ValueError:
-            raise TemplateValidationError(f"Invalid personality_tone: {template_data['personality_tone']}")
+        personality_tone = template_data['personality_tone']
+        if not isinstance(personality_tone, str) or personality_tone not in _PT_BY_VALUE:
+            raise TemplateValidationError(f"Invalid personality_tone: {personality_tone}")
     
     return True
 
-def create_template_from_dict(template_data: Dict[str, Any]) -> ConversationTemplate:
+def create_template_from_dict(template_data: Dict[str, Any], _validated: bool = False) -> ConversationTemplate:
     """
     Create ConversationTemplate from dictionary data
+    
+    Pass _validated=True only when validate_template has already been run on
+    template_data (e.g. by the template loader) to skip the second pass.
     """
-    validate_template(template_data)
+    if not _validated:
+        validate_template(template_data)
     
     return ConversationTemplate(
         id=template_data['id'],
         category=template_data['category'],
         emotion_tags=template_data['emotion_tags'],
-        conversation_type=ConversationType(template_data['conversation_type']),
+        conversation_type=_CT_BY_VALUE[template_data['conversation_type']],
         base_template=template_data['base_template'],
         variations=template_data.get('variations', []),
         follow_up_questions=template_data.get('follow_up_questions', []),
         context_requirements=template_data.get('context_requirements', []),
-        personality_tone=PersonalityTone(template_data.get('personality_tone', 'empathetic')),
+        personality_tone=_PT_BY_VALUE[template_data.get('personality_tone', 'empathetic')],
         usage_weight=template_data.get('usage_weight', 1.0),
         min_confidence=template_data.get('min_confidence', 0.5)
     )
\ No newline at end of file
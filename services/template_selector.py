@@ -4,9 +4,13 @@ Selects the best conversation template based on emotion, context, and anti-repet
 """
 
 import logging
-from typing import List, Dict, Optional, Tuple
-from datetime import datetime, timedelta
-from dataclasses import dataclass
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from operator import attrgetter
+from typing import List, Dict, FrozenSet, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
 import random
 
 from services.template_models import (
@@ -15,13 +19,47 @@ from services.template_models import (
     TemplateSelectionCriteria,
     TemplateUsageTracker,
     ConversationType,
-    PersonalityTone
+    PersonalityTone,
+    normalize_emotion,
+    lookup_mask,
+    EMOTION_BITS,
+    CONTEXT_BITS
 )
 from services.template_loader import get_template_loader
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+_MIN_CONFIDENCE = attrgetter('min_confidence')
+
+# Candidates scoring within 20% of the best are eligible for random selection
+TOP_CANDIDATE_RATIO = 0.8
+
+# Preferred tone -> other tones that still suit it
+_COMPATIBLE_TONES = {
+    PersonalityTone.EMPATHETIC: frozenset({PersonalityTone.SUPPORTIVE, PersonalityTone.VALIDATING}),
+    PersonalityTone.GENTLE: frozenset({PersonalityTone.CALMING, PersonalityTone.SUPPORTIVE}),
+    PersonalityTone.ENCOURAGING: frozenset({PersonalityTone.SUPPORTIVE, PersonalityTone.EMPATHETIC}),
+    PersonalityTone.CURIOUS: frozenset({PersonalityTone.GENTLE, PersonalityTone.EMPATHETIC})
+}
+
+# Emotion similarity groups: canonical emotion -> closely related emotions
+_EMOTION_GROUPS = {
+    'sad': ['depressed', 'down', 'upset', 'melancholy'],
+    'happy': ['joyful', 'excited', 'cheerful', 'elated'],
+    'angry': ['mad', 'furious', 'irritated', 'annoyed'],
+    'anxious': ['worried', 'nervous', 'stressed', 'tense'],
+    'confused': ['uncertain', 'lost', 'puzzled', 'unclear'],
+    'tired': ['exhausted', 'drained', 'weary', 'fatigued']
+}
+
+# Flattened view: every emotion (including the canonical one) -> its group
+_EMOTION_TO_GROUP = {
+    emotion: group
+    for group, members in _EMOTION_GROUPS.items()
+    for emotion in (group, *members)
+}
+
+@dataclass(slots=True)
 class SelectionContext:
     """Context information for template selection"""
     user_id: str
@@ -33,15 +71,44 @@ class SelectionContext:
     personality_preference: Optional[PersonalityTone] = None
     conversation_length: int = 0  # Number of exchanges in current conversation
     time_of_day: Optional[str] = None  # morning, afternoon, evening, night
+    
+    # Derived once per request by IntelligentTemplateSelector._prepare_context
+    _emotion_lower: str = field(default='', init=False, repr=False, compare=False)
+    _available_context_set: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    _time_of_day_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _emotion_bit: int = field(default=0, init=False, repr=False, compare=False)
+    _context_mask: int = field(default=0, init=False, repr=False, compare=False)
+
+@lru_cache(maxsize=4096)
+def _emotion_similarity(target_lower: str, template_emotions_lower: FrozenSet[str]) -> float:
+    """
+    Similarity between a lowercased target emotion and a template's lowercased emotions.
+    Depends only on its arguments and template tag sets are reused, so results are memoized.
+    """
+    # Check for direct similarity
+    target_group = _EMOTION_TO_GROUP.get(target_lower)
+    if target_group is not None:
+        for template_emotion in template_emotions_lower:
+            if _EMOTION_TO_GROUP.get(template_emotion) == target_group:
+                return 0.8  # High similarity
+    
+    # Check for neutral compatibility
+    if target_lower == 'neutral' or 'neutral' in template_emotions_lower:
+        return 0.5
+    
+    return 0.2  # Low similarity
 
 class IntelligentTemplateSelector:
     """
     Advanced template selection with emotion matching, context awareness, and anti-repetition
     """
     
-    def __init__(self):
+    def __init__(self, max_trackers: int = 10000):
         self.template_loader = get_template_loader()
-        self.usage_trackers: Dict[str, TemplateUsageTracker] = {}
+        # Per-user usage history, least recently active user evicted first
+        self.usage_trackers: "OrderedDict[str, TemplateUsageTracker]" = OrderedDict()
+        self.max_trackers = max_trackers
+        self._trackers_lock = threading.Lock()
         
         # Scoring weights for different factors
         self.weights = {
@@ -51,81 +118,108 @@ class IntelligentTemplateSelector:
             'personality_match': 0.10,
             'conversation_flow': 0.05
         }
+        # Same weights in scoring order, unpacked once per candidate instead of five dict lookups
+        self._weight_values = tuple(self.weights[name] for name in (
+            'emotion_match', 'context_match', 'anti_repetition', 'personality_match', 'conversation_flow'
+        ))
     
     def select_best_template(self, selection_context: SelectionContext) -> Optional[ConversationTemplate]:
         """
         Select the best template based on comprehensive scoring
         """
+        self._prepare_context(selection_context)
+        
+        # Get candidate templates
+        candidates = self._get_candidate_templates(selection_context)
+        
+        if not candidates:
+            logger.warning(f"No candidate templates found for emotion: {selection_context.emotion}, "
+                         f"type: {selection_context.conversation_type}")
+            return self._get_fallback_template(selection_context)
+        
+        # Score all candidates
+        scored_templates = self._score_templates(candidates, selection_context)
+        
+        if not scored_templates:
+            logger.warning("No templates received scores")
+            return self._get_fallback_template(selection_context)
+        
+        # Select best template with some randomization to avoid predictability
+        selected_template = self._select_from_scored_templates(scored_templates, selection_context)
+        
+        # Record usage for anti-repetition
+        if selected_template:
+            self._record_template_usage(selection_context.user_id, selected_template.id)
+            logger.info(f"Selected template: {selected_template.id} for user: {selection_context.user_id}")
+        
+        return selected_template
+    
+    def _safe_loader_call(self, method, *args) -> Sequence[ConversationTemplate]:
+        """Call a template loader lookup, treating a failure as no matches"""
         try:
-            # Get candidate templates
-            candidates = self._get_candidate_templates(selection_context)
-            
-            if not candidates:
-                logger.warning(f"No candidate templates found for emotion: {selection_context.emotion}, "
-                             f"type: {selection_context.conversation_type}")
-                return self._get_fallback_template(selection_context)
-            
-            # Score all candidates
-            scored_templates = self._score_templates(candidates, selection_context)
-            
-            if not scored_templates:
-                logger.warning("No templates received scores")
-                return self._get_fallback_template(selection_context)
-            
-            # Select best template with some randomization to avoid predictability
-            selected_template = self._select_from_scored_templates(scored_templates, selection_context)
-            
-            # Record usage for anti-repetition
-            if selected_template:
-                self._record_template_usage(selection_context.user_id, selected_template.id)
-                logger.info(f"Selected template: {selected_template.id} for user: {selection_context.user_id}")
-            
-            return selected_template
-            
+            return method(*args)
         except Exception as e:
-            logger.error(f"Error in template selection: {e}")
-            return self._get_fallback_template(selection_context)
+            logger.error(f"Template lookup failed during selection: {e}")
+            return ()
+    
+    def _prepare_context(self, context: SelectionContext):
+        """Compute the per-request values every candidate's scoring reads"""
+        context._emotion_lower = normalize_emotion(context.emotion)
+        context._available_context_set = frozenset(context.available_context or ())
+        context._time_of_day_lower = context.time_of_day.lower() if context.time_of_day else None
+        context._emotion_bit = EMOTION_BITS.get(context._emotion_lower, 0)
+        context._context_mask = lookup_mask(CONTEXT_BITS, context._available_context_set)
     
     def _get_candidate_templates(self, context: SelectionContext) -> List[ConversationTemplate]:
         """Get candidate templates based on emotion and conversation type"""
         candidates = []
+        seen_ids = set()
+        
+        def add(templates):
+            for template in templates:
+                if template.id not in seen_ids:
+                    seen_ids.add(template.id)
+                    candidates.append(template)
+        
+        # Loader buckets are sorted by min_confidence, so the eligible templates are a prefix
+        confidence = context.emotion_confidence
+        
+        def eligible(templates):
+            return templates[:bisect_right(templates, confidence, key=_MIN_CONFIDENCE)]
         
         # Primary: Get templates matching both emotion and conversation type
-        emotion_type_matches = self.template_loader.get_templates_by_emotion_and_type(
-            context.emotion, context.conversation_type
+        emotion_type_matches = self._safe_loader_call(
+            self.template_loader.get_templates_by_emotion_and_type, context.emotion, context.conversation_type
         )
-        candidates.extend(emotion_type_matches)
+        add(eligible(emotion_type_matches))
+        gathered = len(emotion_type_matches)  # before the confidence filter, as the tiers expect
         
         # Secondary: Get templates matching just emotion (if different conversation type)
-        if len(candidates) < 3:  # Need more options
-            emotion_matches = self.template_loader.get_templates_by_emotion(context.emotion)
-            for template in emotion_matches:
-                if template not in candidates:
-                    candidates.append(template)
+        if gathered < 3:  # Need more options
+            emotion_matches = self._safe_loader_call(self.template_loader.get_templates_by_emotion, context.emotion)
+            add(eligible(emotion_matches))
+            gathered = len(emotion_matches)  # a superset of the primary matches
         
         # Tertiary: Get templates matching just conversation type (if different emotion)
-        if len(candidates) < 2:  # Still need more options
-            type_matches = self.template_loader.get_templates_by_type(context.conversation_type)
-            for template in type_matches:
-                if template not in candidates:
-                    candidates.append(template)
-        
-        # Filter by minimum confidence
-        candidates = [
-            template for template in candidates 
-            if context.emotion_confidence >= template.min_confidence
-        ]
+        if gathered < 2:  # Still need more options
+            add(eligible(self._safe_loader_call(
+                self.template_loader.get_templates_by_type, context.conversation_type
+            )))
         
         logger.debug(f"Found {len(candidates)} candidate templates for {context.emotion}/{context.conversation_type}")
         return candidates
     
     def _score_templates(self, candidates: List[ConversationTemplate], 
                         context: SelectionContext) -> List[Tuple[ConversationTemplate, TemplateScore]]:
-        """Score all candidate templates"""
+        """Score candidate templates, dropping any that cannot reach the top-candidate band"""
         scored_templates = []
+        best_total = 0.0
         
         for template in candidates:
-            score = self._calculate_template_score(template, context)
+            score = self._calculate_template_score(template, context, cutoff=best_total * TOP_CANDIDATE_RATIO)
+            if score is None:
+                continue
+            best_total = max(best_total, score.total_score)
             scored_templates.append((template, score))
         
         # Sort by total score (descending)
@@ -134,45 +228,57 @@ class IntelligentTemplateSelector:
         return scored_templates
     
     def _calculate_template_score(self, template: ConversationTemplate, 
-                                 context: SelectionContext) -> TemplateScore:
-        """Calculate comprehensive score for a template"""
+                                 context: SelectionContext,
+                                 cutoff: float = 0.0) -> Optional[TemplateScore]:
+        """
+        Calculate comprehensive score for a template.
+        Components are scored in descending weight order; returns None as soon as
+        the best achievable total falls below cutoff.
+        """
         score = TemplateScore(template_id=template.id)
+        we, wc, wa, wp, wf = self._weight_values
+        # Every component is in [0, 1], so the unscored weight bounds what's left
+        remaining = wc + wa + wp + wf
         
         # 1. Emotion Match Score
         score.emotion_match_score = self._calculate_emotion_match_score(template, context)
+        total = score.emotion_match_score * we
+        if total + remaining < cutoff:
+            return None
         
         # 2. Context Match Score
         score.context_match_score = self._calculate_context_match_score(template, context)
+        total += score.context_match_score * wc
+        remaining -= wc
+        if total + remaining < cutoff:
+            return None
         
         # 3. Anti-Repetition Score
         score.anti_repetition_score = self._calculate_anti_repetition_score(template, context)
+        total += score.anti_repetition_score * wa
+        remaining -= wa
+        if total + remaining < cutoff:
+            return None
         
         # 4. Personality Match Score
         score.personality_match_score = self._calculate_personality_match_score(template, context)
-        
-        # Calculate weighted total score
-        score.total_score = (
-            score.emotion_match_score * self.weights['emotion_match'] +
-            score.context_match_score * self.weights['context_match'] +
-            score.anti_repetition_score * self.weights['anti_repetition'] +
-            score.personality_match_score * self.weights['personality_match']
-        )
+        total += score.personality_match_score * wp
         
         # Add conversation flow bonus
         flow_bonus = self._calculate_conversation_flow_bonus(template, context)
-        score.total_score += flow_bonus * self.weights['conversation_flow']
+        score.total_score = total + flow_bonus * wf
         
         return score
     
     def _calculate_emotion_match_score(self, template: ConversationTemplate, 
                                      context: SelectionContext) -> float:
         """Calculate how well template matches the detected emotion"""
-        if context.emotion.lower() in [tag.lower() for tag in template.emotion_tags]:
+        if context._emotion_bit & template._emotion_mask:
             # Perfect match
             base_score = 1.0
         else:
             # Check for related emotions
-            emotion_similarity = self._get_emotion_similarity(context.emotion, template.emotion_tags)
+            emotion_similarity = _emotion_similarity(context._emotion_lower, template._emotion_tag_set)
             base_score = emotion_similarity
         
         # Adjust by confidence
@@ -186,20 +292,16 @@ class IntelligentTemplateSelector:
     def _calculate_context_match_score(self, template: ConversationTemplate, 
                                      context: SelectionContext) -> float:
         """Calculate how well available context matches template requirements"""
-        if not template.context_requirements:
+        required = template._context_mask
+        if not required:
             return 1.0  # No requirements = perfect match
         
-        available_context_set = set(context.available_context)
-        required_context_set = set(template.context_requirements)
-        
-        if required_context_set.issubset(available_context_set):
+        available = context._context_mask
+        if not required & ~available:
             return 1.0  # All requirements met
         
         # Partial match scoring
-        matched_requirements = len(required_context_set.intersection(available_context_set))
-        total_requirements = len(required_context_set)
-        
-        return matched_requirements / total_requirements if total_requirements > 0 else 0.0
+        return (required & available).bit_count() / required.bit_count()
     
     def _calculate_anti_repetition_score(self, template: ConversationTemplate, 
                                        context: SelectionContext) -> float:
@@ -210,22 +312,18 @@ class IntelligentTemplateSelector:
     def _calculate_personality_match_score(self, template: ConversationTemplate, 
                                          context: SelectionContext) -> float:
         """Calculate personality tone match score"""
-        if not context.personality_preference:
+        return self._personality_match(context.personality_preference, template.personality_tone)
+    
+    def _personality_match(self, preference: Optional[PersonalityTone], tone: PersonalityTone) -> float:
+        """Score a template tone against the preferred tone"""
+        if not preference:
             return 0.5  # Neutral score if no preference
         
-        if template.personality_tone == context.personality_preference:
+        if tone == preference:
             return 1.0
         
         # Check for compatible personality tones
-        compatibility_map = {
-            PersonalityTone.EMPATHETIC: [PersonalityTone.SUPPORTIVE, PersonalityTone.VALIDATING],
-            PersonalityTone.GENTLE: [PersonalityTone.CALMING, PersonalityTone.SUPPORTIVE],
-            PersonalityTone.ENCOURAGING: [PersonalityTone.SUPPORTIVE, PersonalityTone.EMPATHETIC],
-            PersonalityTone.CURIOUS: [PersonalityTone.GENTLE, PersonalityTone.EMPATHETIC]
-        }
-        
-        compatible_tones = compatibility_map.get(context.personality_preference, [])
-        if template.personality_tone in compatible_tones:
+        if tone in _COMPATIBLE_TONES.get(preference, ()):
             return 0.7
         
         return 0.3  # Low but not zero for non-matching tones
@@ -236,7 +334,7 @@ class IntelligentTemplateSelector:
         bonus = 0.0
         
         # Bonus for templates with follow-up questions in longer conversations
-        if context.conversation_length > 3 and template.follow_up_questions:
+        if context.conversation_length > 3 and template._has_follow_ups:
             bonus += 0.3
         
         # Bonus for greeting templates at conversation start
@@ -244,11 +342,11 @@ class IntelligentTemplateSelector:
             bonus += 0.5
         
         # Time-of-day considerations (if available)
-        if context.time_of_day:
-            if context.time_of_day in ['evening', 'night'] and 'calm' in template.base_template.lower():
+        time_of_day = context._time_of_day_lower
+        if time_of_day:
+            if time_of_day in ('evening', 'night') and template._has_calm:
                 bonus += 0.2
-            elif context.time_of_day == 'morning' and any(word in template.base_template.lower() 
-                                                        for word in ['energy', 'fresh', 'new']):
+            elif time_of_day == 'morning' and template._has_morning_keyword:
                 bonus += 0.2
         
         return min(bonus, 1.0)
@@ -261,7 +359,7 @@ class IntelligentTemplateSelector:
         
         # Get top candidates (within 20% of best score)
         best_score = scored_templates[0][1].total_score
-        threshold = best_score * 0.8
+        threshold = best_score * TOP_CANDIDATE_RATIO
         
         top_candidates = [
             (template, score) for template, score in scored_templates 
@@ -272,47 +370,25 @@ class IntelligentTemplateSelector:
         if len(top_candidates) == 1:
             return top_candidates[0][0]
         
-        # Create weighted list (higher scores more likely to be selected)
-        weighted_candidates = []
-        for template, score in top_candidates:
-            weight = int(score.total_score * 100)  # Convert to integer weight
-            weighted_candidates.extend([template] * max(1, weight))
-        
-        return random.choice(weighted_candidates)
-    
-    def _get_emotion_similarity(self, target_emotion: str, template_emotions: List[str]) -> float:
-        """Calculate similarity between target emotion and template emotions"""
-        # Emotion similarity mapping
-        emotion_groups = {
-            'sad': ['depressed', 'down', 'upset', 'melancholy'],
-            'happy': ['joyful', 'excited', 'cheerful', 'elated'],
-            'angry': ['mad', 'furious', 'irritated', 'annoyed'],
-            'anxious': ['worried', 'nervous', 'stressed', 'tense'],
-            'confused': ['uncertain', 'lost', 'puzzled', 'unclear'],
-            'tired': ['exhausted', 'drained', 'weary', 'fatigued']
-        }
-        
-        target_lower = target_emotion.lower()
-        template_emotions_lower = [emotion.lower() for emotion in template_emotions]
-        
-        # Check for direct similarity
-        for emotion_group, similar_emotions in emotion_groups.items():
-            if target_lower in similar_emotions or target_lower == emotion_group:
-                for template_emotion in template_emotions_lower:
-                    if template_emotion in similar_emotions or template_emotion == emotion_group:
-                        return 0.8  # High similarity
-        
-        # Check for neutral compatibility
-        if target_lower == 'neutral' or 'neutral' in template_emotions_lower:
-            return 0.5
-        
-        return 0.2  # Low similarity
+        # Higher scores more likely to be selected; floor keeps zero scores selectable
+        templates = [template for template, _ in top_candidates]
+        weights = [max(score.total_score, 0.01) for _, score in top_candidates]
+        return random.choices(templates, weights=weights)[0]
     
     def _get_usage_tracker(self, user_id: str) -> TemplateUsageTracker:
-        """Get or create usage tracker for user"""
-        if user_id not in self.usage_trackers:
-            self.usage_trackers[user_id] = TemplateUsageTracker(user_id=user_id)
-        return self.usage_trackers[user_id]
+        """Get or create usage tracker for user, evicting the least recently active one when full"""
+        with self._trackers_lock:
+            tracker = self.usage_trackers.get(user_id)
+            if tracker is not None:
+                self.usage_trackers.move_to_end(user_id)
+                return tracker
+            
+            tracker = TemplateUsageTracker(user_id=user_id)
+            self.usage_trackers[user_id] = tracker
+            if len(self.usage_trackers) > self.max_trackers:
+                evicted_id, _ = self.usage_trackers.popitem(last=False)
+                logger.debug(f"Evicted template usage history for user: {evicted_id}")
+            return tracker
     
     def _record_template_usage(self, user_id: str, template_id: str):
         """Record template usage for anti-repetition tracking"""
@@ -322,19 +398,19 @@ class IntelligentTemplateSelector:
     def _get_fallback_template(self, context: SelectionContext) -> Optional[ConversationTemplate]:
         """Get a fallback template when no good matches are found"""
         # Try to get any template matching the conversation type
-        type_templates = self.template_loader.get_templates_by_type(context.conversation_type)
+        type_templates = self._safe_loader_call(self.template_loader.get_templates_by_type, context.conversation_type)
         if type_templates:
             return random.choice(type_templates)
         
         # Try to get any template matching the emotion
-        emotion_templates = self.template_loader.get_templates_by_emotion(context.emotion)
+        emotion_templates = self._safe_loader_call(self.template_loader.get_templates_by_emotion, context.emotion)
         if emotion_templates:
             return random.choice(emotion_templates)
         
         # Last resort: get any template
-        all_templates = self.template_loader.get_all_templates()
+        all_templates = self.template_loader.get_all_templates_list()
         if all_templates:
-            return random.choice(list(all_templates.values()))
+            return random.choice(all_templates)
         
         logger.error("No fallback templates available")
         return None
@@ -360,24 +436,29 @@ class IntelligentTemplateSelector:
         stats['most_used_templates'] = sorted_templates[:5]
         
         # Get recent selections (last 24 hours)
-        cutoff_time = datetime.now() - timedelta(hours=24)
         for template_id, usages in usage_tracker.template_usage.items():
-            recent_usages = [usage for usage in usages if usage > cutoff_time]
-            if recent_usages:
+            recent_count = usage_tracker.get_usage_count(template_id, hours_back=24)
+            if recent_count:
                 stats['recent_selections'].append({
                     'template_id': template_id,
-                    'count': len(recent_usages),
-                    'last_used': max(recent_usages).isoformat()
+                    'count': recent_count,
+                    'last_used': usage_tracker.usage_datetime(usages[-1]).isoformat()
                 })
         
         return stats
 
 # Global selector instance
 _template_selector = None
+_template_selector_lock = threading.Lock()
 
 def get_template_selector() -> IntelligentTemplateSelector:
     """Get global template selector instance"""
     global _template_selector
-    if _template_selector is None:
-        _template_selector = IntelligentTemplateSelector()
-    return _template_selector
\ No newline at end of file
+    selector = _template_selector
+    if selector is None:
+        # Double-checked so only first calls take the lock and racing ones build it once
+        with _template_selector_lock:
+            selector = _template_selector
+            if selector is None:
+                selector = _template_selector = IntelligentTemplateSelector()
+    return selector
\ No newline at end of file
@@ -3,11 +3,25 @@ Template Validator for Enhanced Conversation System
 Provides comprehensive validation and categorization for conversation templates
 """
 
+import os
 import re
+import sys
 import logging
-from typing import Dict, List, Tuple, Optional, Set
+from bisect import bisect_right
+from itertools import compress
+from operator import itemgetter
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Tuple, Optional, Set
 from dataclasses import dataclass
 
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasick is optional; without it keywords are found by token lookup and phrase search
+    ahocorasick = None
+
 from services.template_models import (
     ConversationTemplate, 
     ConversationType, 
@@ -17,23 +31,228 @@ from services.template_models import (
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Validation/categorization results kept per validator, keyed by template content
+RESULT_CACHE_SIZE = 4096
+
+# Batches larger than this are split across threads on free-threaded (no-GIL) builds
+PARALLEL_BATCH_THRESHOLD = 32
+
+def _scan_placeholders(text: str) -> List[str]:
+    """
+    Names inside {...} in text, left to right; same results as re.findall(r'\{([^}]+)\}', text).
+    A plain find loop: templates hold only a few placeholders, so regex setup would dominate.
+    """
+    names = []
+    start = text.find('{')
+    while start >= 0:
+        end = text.find('}', start + 1)
+        if end < 0:
+            break
+        if end > start + 1:
+            names.append(text[start + 1:end])
+            start = text.find('{', end + 1)
+        else:
+            # '{}' holds no name; carry on from the brace that closed it
+            start = text.find('{', end)
+    return names
+
+# Runs of letters. A single-word keyword (letters only) occurs in the text exactly
+# when it occurs inside one of these tokens, so matching can work per distinct token.
+_WORD_RE = re.compile(r"[a-z]+")
+
+def _tokenize(text_lower: str) -> FrozenSet[str]:
+    """Distinct runs of letters in lowercased text"""
+    return frozenset(_WORD_RE.findall(text_lower))
+
+# Joins texts for batch scanning (ASCII unit separator)
+_TEXT_SEPARATOR = '\x1f'
+
+def _text_starts(texts: List[str]) -> List[int]:
+    """Start offset of each text within _TEXT_SEPARATOR.join(texts)"""
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
+    return starts
+
+_EMPATHY_WORDS = frozenset(['understand', 'hear', 'feel', 'sense', 'with you', 'listen'])
+_CLINICAL_WORDS = frozenset(['diagnose', 'treatment', 'therapy', 'disorder', 'condition'])
+
+class KeywordIndex:
+    """
+    Finds which of a fixed set of keywords occur (as substrings) in a text.
+    Uses one Aho-Corasick scan when pyahocorasick is installed, otherwise
+    memoized per-token lookup for single words plus substring search for phrases.
+    """
+    
+    def __init__(self, keywords: FrozenSet[str]):
+        self.words = frozenset(kw for kw in keywords if _WORD_RE.fullmatch(kw))
+        self.phrases = tuple(kw for kw in keywords if kw not in self.words)
+        self._word_list = tuple(self.words)
+        self._token_keywords: Dict[str, FrozenSet[str]] = {}
+        self._automaton = None
+        self.uses_tokens = ahocorasick is None
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+    
+    def find(self, text_lower: str, tokens: Optional[FrozenSet[str]] = None) -> FrozenSet[str]:
+        """
+        Keywords occurring anywhere in the lowercased text.
+        tokens may pass in _tokenize(text_lower) when already known; it is only read when uses_tokens.
+        """
+        if self._automaton is not None:
+            # (end, keyword) pairs straight from the automaton's C iterator
+            return frozenset(map(itemgetter(1), self._automaton.iter(text_lower)))
+        
+        found = set()
+        token_keywords = self._token_keywords
+        if tokens is None:
+            tokens = _tokenize(text_lower)
+        for token in tokens:
+            keywords = token_keywords.get(token)
+            if keywords is None:
+                # template vocabulary is small and repetitive, so this stays bounded
+                keywords = token_keywords[token] = frozenset(
+                    compress(self._word_list, map(token.__contains__, self._word_list))
+                )
+            found.update(keywords)
+        found.update(compress(self.phrases, map(text_lower.__contains__, self.phrases)))
+        return frozenset(found)
+    
+    def find_many(self, texts_lower: List[str],
+                  token_sets: Optional[List[FrozenSet[str]]] = None) -> List[FrozenSet[str]]:
+        """
+        Keywords present in each of several lowercased texts.
+        With the automaton, all texts are scanned as one buffer and matches are
+        mapped back to their text by offset.
+        """
+        if self._automaton is None:
+            if token_sets is None:
+                return [self.find(text) for text in texts_lower]
+            return [self.find(text, tokens) for text, tokens in zip(texts_lower, token_sets)]
+        
+        # Keywords never contain the separator, so no match can span two texts
+        starts = _text_starts(texts_lower)
+        found = [set() for _ in texts_lower]
+        for end, keyword in self._automaton.iter(_TEXT_SEPARATOR.join(texts_lower)):
+            found[bisect_right(starts, end) - 1].add(keyword)
+        return [frozenset(keywords) for keywords in found]
+
+# Suggestion texts by code; suggestions are kept as (code, args) and only rendered on request
+SUGGESTION_MESSAGES = {
+    'add_variations': "Consider adding variations to avoid repetitive responses",
+    'more_variations': "Consider adding more variations (recommended: 3-5)",
+    'add_follow_ups': "Consider adding follow-up questions to encourage conversation",
+    'add_empathy': "Consider adding empathetic language to show understanding",
+    'add_questions': "Consider adding questions to encourage user engagement",
+    'emotion_keywords': "Template tagged as '{0}' but doesn't contain typical keywords. Consider adding: {1}",
+    'tone_indicators': "Template marked as '{0}' but doesn't reflect this tone. Consider adding phrases like: {1}",
+}
+
+Suggestion = Tuple[str, Tuple[str, ...]]
+
+@dataclass(slots=True)
 class ValidationResult:
     """Result of template validation"""
     is_valid: bool
     errors: List[str]
     warnings: List[str]
-    suggestions: List[str]
+    suggestions: List[Suggestion]  # (code, args) into SUGGESTION_MESSAGES
+    
+    @property
+    def formatted_suggestions(self) -> List[str]:
+        """Suggestions rendered as readable text"""
+        return [SUGGESTION_MESSAGES[code].format(*args) for code, args in self.suggestions]
 
 class TemplateValidator:
     """
     Comprehensive validator for conversation templates
     """
     
-    def __init__(self):
-        self.placeholder_pattern = re.compile(r'\{([^}]+)\}')
+    # Valid placeholder names (Python identifiers)
+    _IDENT_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+    
+    def __init__(self, cache_size: int = RESULT_CACHE_SIZE):
         self.emotion_keywords = self._load_emotion_keywords()
         self.personality_indicators = self._load_personality_indicators()
+        self.conversation_type_indicators = self._load_conversation_type_indicators()
+        
+        # Keyword sets per category; counts are intersections with one scan of the text
+        self._emotion_sets = {e: frozenset(kws) for e, kws in self.emotion_keywords.items()}
+        self._personality_sets = {t: frozenset(inds) for t, inds in self.personality_indicators.items()}
+        self._conversation_type_sets = {
+            c: frozenset(inds) for c, inds in self.conversation_type_indicators.items()
+        }
+        self._keyword_index = KeywordIndex(frozenset().union(
+            *self._emotion_sets.values(), *self._personality_sets.values(),
+            *self._conversation_type_sets.values(), _EMPATHY_WORDS, _CLINICAL_WORDS
+        ))
+        
+        # Per emotion tag / tone: (keywords, suggested examples), found with a single lookup
+        self._emotion_checks = {
+            emotion: (self._emotion_sets[emotion], ', '.join(keywords[:3]))
+            for emotion, keywords in self.emotion_keywords.items()
+        }
+        self._tone_checks = {
+            tone: (self._personality_sets[tone], ', '.join(indicators[:2]))
+            for tone, indicators in self.personality_indicators.items()
+        }
+        
+        # Categorization tables inverted once: keyword -> (table, category position) pairs,
+        # so categorizing only visits the keywords actually found
+        category_tables = (self._emotion_sets, self._personality_sets, self._conversation_type_sets)
+        self._category_keys = tuple(tuple(table) for table in category_tables)
+        self._keyword_categories: Dict[str, List[Tuple[int, int]]] = {}
+        for table_index, table in enumerate(category_tables):
+            for position, keywords in enumerate(table.values()):
+                for keyword in keywords:
+                    self._keyword_categories.setdefault(keyword, []).append((table_index, position))
+        
+        # LRU caches of results; templates are re-validated unchanged far more often than edited
+        self.cache_size = cache_size
+        # template id -> (content fingerprint, result); an edited template replaces its old entry
+        self._validation_cache: "OrderedDict[str, Tuple[tuple, ValidationResult]]" = OrderedDict()
+        self._category_cache: "OrderedDict[str, Dict[str, any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def _cache_get(self, cache: OrderedDict, key):
+        """Look up a cached result, marking it most recently used"""
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache: OrderedDict, key, value):
+        """Store a result, evicting the least recently used one when full"""
+        with self._cache_lock:
+            cache[key] = value
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+    
+    def clear_cache(self):
+        """Drop all cached validation and categorization results"""
+        with self._cache_lock:
+            self._validation_cache.clear()
+            self._category_cache.clear()
+    
+    def _template_tokens(self, template: ConversationTemplate, text_lower: str) -> FrozenSet[str]:
+        """Word tokens of a template's base text, kept on the template until the text changes"""
+        memo = template._text_tokens
+        if memo is None or memo[0] != text_lower:
+            memo = template._text_tokens = (text_lower, _tokenize(text_lower))
+        return memo[1]
+    
+    def _find_keywords(self, template: ConversationTemplate) -> FrozenSet[str]:
+        """Keywords present in a template's base text"""
+        text_lower = template.base_template.lower()
+        if self._keyword_index.uses_tokens:
+            return self._keyword_index.find(text_lower, self._template_tokens(template, text_lower))
+        return self._keyword_index.find(text_lower)
     
     def _load_emotion_keywords(self) -> Dict[str, List[str]]:
         """Load emotion-specific keywords for validation"""
@@ -59,40 +278,94 @@ class TemplateValidator:
             PersonalityTone.CALMING: ['breathe', 'calm', 'peaceful', 'safe', 'relax']
         }
     
+    def _load_conversation_type_indicators(self) -> Dict[ConversationType, List[str]]:
+        """Load conversation type indicators"""
+        return {
+            ConversationType.GREETING: ['hello', 'hi', 'welcome', 'good to see'],
+            ConversationType.GOODBYE: ['goodbye', 'take care', 'until', 'farewell'],
+            ConversationType.EMOTIONAL_SUPPORT: ['sorry', 'understand', 'here for you', 'listen'],
+            ConversationType.CASUAL_CHAT: ['chat', 'talk', 'conversation', 'what\'s new'],
+            ConversationType.MEMORY_RECALL: ['remember', 'recall', 'mentioned', 'told me'],
+            ConversationType.ADVICE_SEEKING: ['help', 'advice', 'suggest', 'what should'],
+            ConversationType.CELEBRATION: ['wonderful', 'amazing', 'congratulations', 'celebrate']
+        }
+    
     def validate_template(self, template: ConversationTemplate) -> ValidationResult:
         """
-        Comprehensive validation of a conversation template
+        Comprehensive validation of a conversation template.
+        Results are cached by every field the checks read, so unchanged templates are not re-validated.
+        """
+        return self.validate_templates([template])[0]
+    
+    def validate_templates(self, templates: List[ConversationTemplate]) -> List[ValidationResult]:
         """
+        Validate several templates, in order.
+        Texts of templates not already cached are scanned for keywords in a single pass.
+        """
+        # Every field the checks read besides the id. Compared by equality, so a
+        # fingerprint can never collide; only the id is hashed for the lookup.
+        fingerprints = [
+            (
+                template.base_template, tuple(template.variations),
+                tuple(template.emotion_tags), template.personality_tone,
+                tuple(template.context_requirements), bool(template.follow_up_questions)
+            )
+            for template in templates
+        ]
+        cached = []
+        for template, fingerprint in zip(templates, fingerprints):
+            entry = self._cache_get(self._validation_cache, template.id)
+            cached.append(entry[1] if entry is not None and entry[0] == fingerprint else None)
+        
+        misses = [i for i, result in enumerate(cached) if result is None]
+        if misses:
+            texts = [templates[i].base_template for i in misses]
+            texts_lower = [text.lower() for text in texts]
+            token_sets = None
+            if self._keyword_index.uses_tokens:
+                token_sets = [
+                    self._template_tokens(templates[i], text_lower)
+                    for i, text_lower in zip(misses, texts_lower)
+                ]
+            found_sets = self._keyword_index.find_many(texts_lower, token_sets)
+            for i, text, found in zip(misses, texts, found_sets):
+                cached[i] = self._validate_uncached(templates[i], found, _scan_placeholders(text))
+                self._cache_put(self._validation_cache, templates[i].id, (fingerprints[i], cached[i]))
+        
+        # Callers own their lists; the cached copies stay untouched
+        return [
+            ValidationResult(
+                is_valid=result.is_valid,
+                errors=list(result.errors),
+                warnings=list(result.warnings),
+                suggestions=list(result.suggestions)
+            )
+            for result in cached
+        ]
+    
+    def _validate_uncached(self, template: ConversationTemplate,
+                           found: Optional[FrozenSet[str]] = None,
+                           placeholders: Optional[List[str]] = None) -> ValidationResult:
+        """
+        Run every validation check on a template.
+        found and placeholders are the keyword set of its lowercased text and its
+        placeholder names, when already computed by a batch scan.
+        """
+        if found is None:
+            found = self._find_keywords(template)
+        if placeholders is None:
+            placeholders = self._extract_placeholders(template.base_template)
+        
+        # Each check appends straight into these lists
         errors = []
         warnings = []
         suggestions = []
         
-        # Basic structure validation
-        structure_result = self._validate_structure(template)
-        errors.extend(structure_result.errors)
-        warnings.extend(structure_result.warnings)
-        suggestions.extend(structure_result.suggestions)
-        
-        # Content validation
-        content_result = self._validate_content(template)
-        errors.extend(content_result.errors)
-        warnings.extend(content_result.warnings)
-        suggestions.extend(content_result.suggestions)
-        
-        # Emotion alignment validation
-        emotion_result = self._validate_emotion_alignment(template)
-        warnings.extend(emotion_result.warnings)
-        suggestions.extend(emotion_result.suggestions)
-        
-        # Personality consistency validation
-        personality_result = self._validate_personality_consistency(template)
-        warnings.extend(personality_result.warnings)
-        suggestions.extend(personality_result.suggestions)
-        
-        # Context requirements validation
-        context_result = self._validate_context_requirements(template)
-        errors.extend(context_result.errors)
-        warnings.extend(context_result.warnings)
+        self._validate_structure(template, errors, warnings, suggestions)
+        self._validate_content(template, found, placeholders, errors, warnings, suggestions)
+        self._validate_emotion_alignment(template, found, suggestions)
+        self._validate_personality_consistency(template, found, suggestions)
+        self._validate_context_requirements(template, placeholders, errors, warnings)
         
         is_valid = len(errors) == 0
         
@@ -103,12 +376,9 @@ class TemplateValidator:
             suggestions=suggestions
         )
     
-    def _validate_structure(self, template: ConversationTemplate) -> ValidationResult:
+    def _validate_structure(self, template: ConversationTemplate, errors: List[str],
+                            warnings: List[str], suggestions: List[Suggestion]):
         """Validate basic template structure"""
-        errors = []
-        warnings = []
-        suggestions = []
-        
         # Required fields
         if not template.id:
             errors.append("Template ID is required")
@@ -128,100 +398,66 @@ class TemplateValidator:
         
         # Variations validation
         if not template.variations:
-            suggestions.append("Consider adding variations to avoid repetitive responses")
+            suggestions.append(('add_variations', ()))
         elif len(template.variations) < 3:
-            suggestions.append("Consider adding more variations (recommended: 3-5)")
+            suggestions.append(('more_variations', ()))
         
         # Follow-up questions validation
         if not template.follow_up_questions:
-            suggestions.append("Consider adding follow-up questions to encourage conversation")
-        
-        return ValidationResult(True, errors, warnings, suggestions)
+            suggestions.append(('add_follow_ups', ()))
     
-    def _validate_content(self, template: ConversationTemplate) -> ValidationResult:
+    def _validate_content(self, template: ConversationTemplate, found: FrozenSet[str],
+                          placeholders: List[str], errors: List[str], warnings: List[str],
+                          suggestions: List[Suggestion]):
         """Validate template content quality"""
-        errors = []
-        warnings = []
-        suggestions = []
-        
-        # Check for placeholders
-        placeholders = self._extract_placeholders(template.base_template)
-        
         # Validate placeholder format
         for placeholder in placeholders:
-            if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', placeholder):
+            if not self._IDENT_RE.fullmatch(placeholder):
                 errors.append(f"Invalid placeholder format: {{{placeholder}}}")
         
         # Check for common placeholders
         if 'user_name' in template.base_template and 'user_name' not in placeholders:
             errors.append("Template references user_name but placeholder is malformed")
         
-        # Content quality checks
-        text_lower = template.base_template.lower()
-        
         # Check for empathy indicators
-        empathy_words = ['understand', 'hear', 'feel', 'sense', 'with you', 'listen']
-        if not any(word in text_lower for word in empathy_words):
-            suggestions.append("Consider adding empathetic language to show understanding")
+        if _EMPATHY_WORDS.isdisjoint(found):
+            suggestions.append(('add_empathy', ()))
         
         # Check for questions or engagement
         if '?' not in template.base_template and not template.follow_up_questions:
-            suggestions.append("Consider adding questions to encourage user engagement")
+            suggestions.append(('add_questions', ()))
         
         # Check for overly clinical language
-        clinical_words = ['diagnose', 'treatment', 'therapy', 'disorder', 'condition']
-        if any(word in text_lower for word in clinical_words):
+        if not _CLINICAL_WORDS.isdisjoint(found):
             warnings.append("Avoid clinical language - focus on supportive conversation")
-        
-        return ValidationResult(True, errors, warnings, suggestions)
     
-    def _validate_emotion_alignment(self, template: ConversationTemplate) -> ValidationResult:
+    def _validate_emotion_alignment(self, template: ConversationTemplate, found: FrozenSet[str],
+                                    suggestions: List[Suggestion]):
         """Validate that template content aligns with emotion tags"""
-        warnings = []
-        suggestions = []
-        
-        text_lower = template.base_template.lower()
-        
+        emotion_checks = self._emotion_checks
         for emotion_tag in template.emotion_tags:
-            if emotion_tag in self.emotion_keywords:
-                expected_keywords = self.emotion_keywords[emotion_tag]
-                found_keywords = [kw for kw in expected_keywords if kw in text_lower]
+            check = emotion_checks.get(emotion_tag)
+            if check is not None:
+                expected_keywords, examples = check
                 
-                if not found_keywords:
-                    suggestions.append(
-                        f"Template tagged as '{emotion_tag}' but doesn't contain typical "
-                        f"keywords. Consider adding: {', '.join(expected_keywords[:3])}"
-                    )
-        
-        return ValidationResult(True, [], warnings, suggestions)
+                if expected_keywords.isdisjoint(found):
+                    suggestions.append(('emotion_keywords', (emotion_tag, examples)))
     
-    def _validate_personality_consistency(self, template: ConversationTemplate) -> ValidationResult:
+    def _validate_personality_consistency(self, template: ConversationTemplate, found: FrozenSet[str],
+                                          suggestions: List[Suggestion]):
         """Validate personality tone consistency"""
-        warnings = []
-        suggestions = []
-        
-        text_lower = template.base_template.lower()
         personality_tone = template.personality_tone
+        check = self._tone_checks.get(personality_tone)
         
-        if personality_tone in self.personality_indicators:
-            expected_indicators = self.personality_indicators[personality_tone]
-            found_indicators = [ind for ind in expected_indicators if ind in text_lower]
+        if check is not None:
+            expected_indicators, examples = check
             
-            if not found_indicators:
-                suggestions.append(
-                    f"Template marked as '{personality_tone.value}' but doesn't reflect this tone. "
-                    f"Consider adding phrases like: {', '.join(expected_indicators[:2])}"
-                )
-        
-        return ValidationResult(True, [], warnings, suggestions)
+            if expected_indicators.isdisjoint(found):
+                suggestions.append(('tone_indicators', (personality_tone.value, examples)))
     
-    def _validate_context_requirements(self, template: ConversationTemplate) -> ValidationResult:
+    def _validate_context_requirements(self, template: ConversationTemplate, placeholders: List[str],
+                                       errors: List[str], warnings: List[str]):
         """Validate context requirements match template content"""
-        errors = []
-        warnings = []
-        
-        placeholders = self._extract_placeholders(template.base_template)
-        
         # Check if all placeholders are in context requirements
         for placeholder in placeholders:
             if placeholder not in template.context_requirements:
@@ -229,69 +465,54 @@ class TemplateValidator:
                     f"Template uses placeholder '{{{placeholder}}}' but doesn't require it in context"
                 )
         
-        # Check if context requirements are actually used
+        # Check if context requirements are actually used (in the base text or any variation)
+        used_placeholders = set(placeholders)
+        for variation in template.variations:
+            used_placeholders.update(_scan_placeholders(variation))
+        
         for requirement in template.context_requirements:
-            if f'{{{requirement}}}' not in template.base_template:
-                # Check variations too
-                used_in_variations = any(
-                    f'{{{requirement}}}' in variation 
-                    for variation in template.variations
+            if requirement not in used_placeholders:
+                warnings.append(
+                    f"Context requirement '{requirement}' is specified but not used in template"
                 )
-                if not used_in_variations:
-                    warnings.append(
-                        f"Context requirement '{requirement}' is specified but not used in template"
-                    )
-        
-        return ValidationResult(True, errors, warnings, [])
     
     def _extract_placeholders(self, text: str) -> List[str]:
         """Extract placeholder names from template text"""
-        matches = self.placeholder_pattern.findall(text)
-        return matches
+        return _scan_placeholders(text)
     
     def categorize_template(self, template: ConversationTemplate) -> Dict[str, any]:
         """
-        Automatically categorize template based on content analysis
+        Automatically categorize template based on content analysis.
+        Only the base text is read, so results are cached by it.
         """
-        text_lower = template.base_template.lower()
+        categories = self._cache_get(self._category_cache, template.base_template)
+        if categories is None:
+            categories = self._categorize_keywords(self._find_keywords(template))
+            self._cache_put(self._category_cache, template.base_template, categories)
         
-        # Analyze emotion indicators
-        detected_emotions = []
-        for emotion, keywords in self.emotion_keywords.items():
-            keyword_count = sum(1 for kw in keywords if kw in text_lower)
-            if keyword_count > 0:
-                detected_emotions.append((emotion, keyword_count))
-        
-        # Sort by keyword count
-        detected_emotions.sort(key=lambda x: x[1], reverse=True)
-        
-        # Analyze personality tone
-        detected_tones = []
-        for tone, indicators in self.personality_indicators.items():
-            indicator_count = sum(1 for ind in indicators if ind in text_lower)
-            if indicator_count > 0:
-                detected_tones.append((tone, indicator_count))
-        
-        detected_tones.sort(key=lambda x: x[1], reverse=True)
-        
-        # Analyze conversation type
-        conversation_type_indicators = {
-            ConversationType.GREETING: ['hello', 'hi', 'welcome', 'good to see'],
-            ConversationType.GOODBYE: ['goodbye', 'take care', 'until', 'farewell'],
-            ConversationType.EMOTIONAL_SUPPORT: ['sorry', 'understand', 'here for you', 'listen'],
-            ConversationType.CASUAL_CHAT: ['chat', 'talk', 'conversation', 'what\'s new'],
-            ConversationType.MEMORY_RECALL: ['remember', 'recall', 'mentioned', 'told me'],
-            ConversationType.ADVICE_SEEKING: ['help', 'advice', 'suggest', 'what should'],
-            ConversationType.CELEBRATION: ['wonderful', 'amazing', 'congratulations', 'celebrate']
+        return {
+            **categories,
+            'suggested_emotions': list(categories['suggested_emotions']),
+            'confidence_scores': dict(categories['confidence_scores'])
         }
-        
-        detected_types = []
-        for conv_type, indicators in conversation_type_indicators.items():
-            indicator_count = sum(1 for ind in indicators if ind in text_lower)
-            if indicator_count > 0:
-                detected_types.append((conv_type, indicator_count))
-        
-        detected_types.sort(key=lambda x: x[1], reverse=True)
+    
+    def _categorize_keywords(self, found: FrozenSet[str]) -> Dict[str, any]:
+        """Keyword analysis behind categorize_template, from the keywords found in its text"""
+        # Count matched keywords per emotion, personality tone and conversation type
+        counts = ({}, {}, {})
+        for keyword in found:
+            for table_index, position in self._keyword_categories.get(keyword, ()):
+                table_counts = counts[table_index]
+                table_counts[position] = table_counts.get(position, 0) + 1
+        
+        # Sort by keyword count, ties in table order
+        detected_emotions, detected_tones, detected_types = (
+            [
+                (keys[position], count)
+                for position, count in sorted(table_counts.items(), key=lambda x: (-x[1], x[0]))
+            ]
+            for keys, table_counts in zip(self._category_keys, counts)
+        )
         
         return {
             'suggested_emotions': [emotion for emotion, _ in detected_emotions[:3]],
@@ -304,16 +525,49 @@ class TemplateValidator:
             }
         }
 
+# Global validator instance; its tables are read-only and its result caches are
+# lock-protected, so one instance serves every caller
+_validator = None
+_validator_lock = threading.Lock()
+
+def get_validator() -> TemplateValidator:
+    """Get global template validator instance"""
+    global _validator
+    validator = _validator
+    if validator is None:
+        # Double-checked so only first calls take the lock and racing ones build it once
+        with _validator_lock:
+            validator = _validator
+            if validator is None:
+                validator = _validator = TemplateValidator()
+    return validator
+
 def validate_template_batch(templates: List[ConversationTemplate]) -> Dict[str, ValidationResult]:
     """Validate multiple templates and return results"""
-    validator = TemplateValidator()
+    validator = get_validator()
     results = {}
     
-    for template in templates:
-        results[template.id] = validator.validate_template(template)
+    if len(templates) > PARALLEL_BATCH_THRESHOLD and _gil_disabled():
+        # Each chunk still gets validate_templates' single keyword/placeholder scan
+        workers = os.cpu_count() or 1
+        chunk_size = max(1, len(templates) // (4 * workers))
+        chunks = [templates[i:i + chunk_size] for i in range(0, len(templates), chunk_size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            validated = [result for chunk in executor.map(validator.validate_templates, chunks)
+                         for result in chunk]
+    else:
+        validated = validator.validate_templates(templates)
+    
+    for template, result in zip(templates, validated):
+        results[template.id] = result
     
     return results
 
+def _gil_disabled() -> bool:
+    """True on a free-threaded interpreter running without the GIL"""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
 def get_validation_summary(results: Dict[str, ValidationResult]) -> Dict[str, any]:
     """Get summary statistics from validation results"""
     total_templates = len(results)
@@ -4,17 +4,49 @@ Generates dynamic variations and manages rotation to avoid monotonous responses
 """
 
 import re
+import time
 import random
 import logging
-from typing import List, Dict, Optional, Tuple, Set
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, Dict, Optional, Tuple, Set
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from services.template_models import ConversationTemplate, PersonalityTone
+from services.template_models import ConversationTemplate, PersonalityTone, split_placeholders
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Generic word swapped for a tone-specific adjective
+_GOOD_RE = re.compile(r'\bgood\b', re.IGNORECASE)
+
+# time_of_day -> replacement for 'today'; follow-ups only adjust morning and evening
+_TODAY_REPL = {
+    'morning': 'this morning',
+    'afternoon': 'this afternoon',
+    'evening': 'this evening',
+    'night': 'this night',
+}
+_FOLLOW_UP_TODAY_REPL = {key: _TODAY_REPL[key] for key in ('morning', 'evening')}
+
+# Rotation restarts after this long even if variations remain unused
+ROTATION_RESET_SECONDS = 24 * 60 * 60
+
+Segments = Tuple[Tuple[str, Optional[str]], ...]
+
+@lru_cache(maxsize=4096)
+def _compile_template(text: str) -> Tuple[Segments, FrozenSet[str]]:
+    """
+    Parse variation text once into (literal, placeholder_name) segments plus the
+    set of placeholder names. Variations are a small fixed vocabulary, so the cache
+    means each text is parsed once per process. Text carrying per-user memory or
+    friend references is parsed with _compile_template.__wrapped__ instead.
+    """
+    segments = split_placeholders(text)
+    return segments, frozenset(name for _, name in segments if name is not None)
+
+@dataclass(slots=True)
 class VariationContext:
     """Context for generating template variations"""
     user_name: str
@@ -25,117 +57,140 @@ class VariationContext:
     time_of_day: Optional[str] = None
     user_preferences: Dict[str, any] = field(default_factory=dict)
 
-@dataclass
+@dataclass(slots=True)
 class RotationState:
     """Tracks rotation state for template variations"""
     template_id: str
-    used_variations: List[int] = field(default_factory=list)
+    used_variations: Set[int] = field(default_factory=set)  # order kept by last_used_index
     last_used_index: int = -1
     rotation_count: int = 0
-    last_reset: datetime = field(default_factory=datetime.now)
+    last_reset_ts: float = field(default_factory=time.monotonic)  # time.monotonic() seconds
+    follow_up_index: int = 0  # next follow-up question, taken round-robin
 
 class TemplateVariationEngine:
     """
     Generates dynamic variations and manages rotation to prevent repetitive responses
     """
     
-    def __init__(self):
-        self.rotation_states: Dict[str, Dict[str, RotationState]] = {}  # user_id -> template_id -> state
+    def __init__(self, max_users: int = 10000, max_templates_per_user: int = 1024):
+        # user_id -> template_id -> state, both levels least-recently-used first
+        self.rotation_states: "OrderedDict[str, OrderedDict[str, RotationState]]" = OrderedDict()
+        self.max_users = max_users
+        self.max_templates_per_user = max_templates_per_user
+        self._states_lock = threading.Lock()
+        # Converts monotonic reset times to wall-clock for stats
+        self._wall_offset = time.time() - time.monotonic()
         self.variation_patterns = self._load_variation_patterns()
         self.personality_modifiers = self._load_personality_modifiers()
         self.contextual_enhancers = self._load_contextual_enhancers()
+        
+        # Engine-local generator, so picks don't go through the random module's shared instance;
+        # constant reference lists are bound with their lengths for direct index picks
+        self._rng = random.Random()
+        self._memory_refs = self.contextual_enhancers['memory_references']
+        self._memory_refs_n = len(self._memory_refs)
+        self._friend_refs = self.contextual_enhancers['friend_references']
+        self._friend_refs_n = len(self._friend_refs)
+        
+        # tone -> (phrases, adjectives), so a modification needs one lookup
+        self._tone_modifiers: Dict[PersonalityTone, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+            tone: (modifiers['phrases'], modifiers['adjectives'])
+            for tone, modifiers in self.personality_modifiers.items()
+        }
+        # (variation text, tone) -> table of personality-decorated texts; see _personality_table
+        self._preassembled: Dict[Tuple[str, PersonalityTone], Tuple[Tuple[str, ...], ...]] = {}
     
-    def _load_variation_patterns(self) -> Dict[str, List[str]]:
+    def _load_variation_patterns(self) -> Dict[str, Tuple[str, ...]]:
         """Load patterns for generating variations"""
         return {
-            'greeting_starters': [
+            'greeting_starters': (
                 "Hello {user_name}!", "Hi there {user_name}!", "Hey {user_name}!",
                 "Welcome back {user_name}!", "Good to see you {user_name}!",
                 "Hi {user_name}, wonderful to connect again!"
-            ],
-            'empathy_expressions': [
+            ),
+            'empathy_expressions': (
                 "I can sense", "I hear", "I understand", "I feel", "I recognize",
                 "I can see", "I notice", "I'm aware", "I perceive"
-            ],
-            'support_phrases': [
+            ),
+            'support_phrases': (
                 "I'm here with you", "You're not alone", "I'm here to listen",
                 "I'm alongside you", "I'm present with you", "I'm here for you"
-            ],
-            'validation_phrases': [
+            ),
+            'validation_phrases': (
                 "That makes complete sense", "Your feelings are valid", 
                 "That's completely understandable", "Anyone would feel that way",
                 "Your reaction is natural", "That's a normal response"
-            ],
-            'curiosity_starters': [
+            ),
+            'curiosity_starters': (
                 "I'm curious about", "I'd love to know more about", "Tell me about",
                 "I'm interested in", "Help me understand", "Share with me about"
-            ],
-            'encouragement_phrases': [
+            ),
+            'encouragement_phrases': (
                 "You're doing great", "That's wonderful", "How amazing",
                 "That's fantastic", "You should be proud", "That's incredible"
-            ]
+            )
         }
     
-    def _load_personality_modifiers(self) -> Dict[PersonalityTone, Dict[str, List[str]]]:
+    def _load_personality_modifiers(self) -> Dict[PersonalityTone, Dict[str, Tuple[str, ...]]]:
         """Load personality-specific modifiers"""
         return {
             PersonalityTone.EMPATHETIC: {
-                'adjectives': ['gentle', 'understanding', 'compassionate', 'caring'],
-                'adverbs': ['gently', 'softly', 'warmly', 'tenderly'],
-                'phrases': ['with understanding', 'with compassion', 'with care']
+                'adjectives': ('gentle', 'understanding', 'compassionate', 'caring'),
+                'adverbs': ('gently', 'softly', 'warmly', 'tenderly'),
+                'phrases': ('with understanding', 'with compassion', 'with care')
             },
             PersonalityTone.ENCOURAGING: {
-                'adjectives': ['inspiring', 'uplifting', 'motivating', 'positive'],
-                'adverbs': ['encouragingly', 'positively', 'hopefully', 'optimistically'],
-                'phrases': ['with enthusiasm', 'with hope', 'with confidence']
+                'adjectives': ('inspiring', 'uplifting', 'motivating', 'positive'),
+                'adverbs': ('encouragingly', 'positively', 'hopefully', 'optimistically'),
+                'phrases': ('with enthusiasm', 'with hope', 'with confidence')
             },
             PersonalityTone.GENTLE: {
-                'adjectives': ['soft', 'peaceful', 'calm', 'soothing'],
-                'adverbs': ['gently', 'peacefully', 'calmly', 'softly'],
-                'phrases': ['with gentleness', 'with peace', 'with calm']
+                'adjectives': ('soft', 'peaceful', 'calm', 'soothing'),
+                'adverbs': ('gently', 'peacefully', 'calmly', 'softly'),
+                'phrases': ('with gentleness', 'with peace', 'with calm')
             },
             PersonalityTone.SUPPORTIVE: {
-                'adjectives': ['strong', 'reliable', 'steady', 'dependable'],
-                'adverbs': ['supportively', 'steadily', 'reliably', 'consistently'],
-                'phrases': ['with support', 'with strength', 'with reliability']
+                'adjectives': ('strong', 'reliable', 'steady', 'dependable'),
+                'adverbs': ('supportively', 'steadily', 'reliably', 'consistently'),
+                'phrases': ('with support', 'with strength', 'with reliability')
             },
             PersonalityTone.CURIOUS: {
-                'adjectives': ['interested', 'engaged', 'attentive', 'fascinated'],
-                'adverbs': ['curiously', 'attentively', 'interestedly', 'eagerly'],
-                'phrases': ['with curiosity', 'with interest', 'with attention']
+                'adjectives': ('interested', 'engaged', 'attentive', 'fascinated'),
+                'adverbs': ('curiously', 'attentively', 'interestedly', 'eagerly'),
+                'phrases': ('with curiosity', 'with interest', 'with attention')
             },
             PersonalityTone.VALIDATING: {
-                'adjectives': ['affirming', 'confirming', 'acknowledging', 'recognizing'],
-                'adverbs': ['validatingly', 'affirmingly', 'acknowledgingly', 'recognizingly'],
-                'phrases': ['with validation', 'with affirmation', 'with recognition']
+                'adjectives': ('affirming', 'confirming', 'acknowledging', 'recognizing'),
+                'adverbs': ('validatingly', 'affirmingly', 'acknowledgingly', 'recognizingly'),
+                'phrases': ('with validation', 'with affirmation', 'with recognition')
             },
             PersonalityTone.CALMING: {
-                'adjectives': ['peaceful', 'tranquil', 'serene', 'relaxing'],
-                'adverbs': ['calmly', 'peacefully', 'serenely', 'tranquilly'],
-                'phrases': ['with peace', 'with tranquility', 'with serenity']
+                'adjectives': ('peaceful', 'tranquil', 'serene', 'relaxing'),
+                'adverbs': ('calmly', 'peacefully', 'serenely', 'tranquilly'),
+                'phrases': ('with peace', 'with tranquility', 'with serenity')
             }
         }
     
-    def _load_contextual_enhancers(self) -> Dict[str, List[str]]:
+    def _load_contextual_enhancers(self) -> Dict[str, Tuple[str, ...]]:
         """Load context-specific enhancers"""
         return {
-            'memory_references': [
+            'memory_references': (
                 "I remember when you mentioned {memory}",
                 "Thinking back to what you shared about {memory}",
                 "I recall you telling me about {memory}",
                 "You mentioned {memory} before"
-            ],
-            'friend_references': [
+            ),
+            'friend_references': (
                 "How is {friend_name} doing?",
                 "Have you talked to {friend_name} about this?",
                 "What does {friend_name} think about this?",
                 "I remember you mentioning {friend_name}"
-            ],
+            ),
             'time_contextual': {
-                'morning': ['starting fresh', 'new beginning', 'morning energy', 'dawn of possibility'],
-                'afternoon': ['midday reflection', 'afternoon thoughts', 'continuing journey'],
-                'evening': ['evening contemplation', 'day reflection', 'peaceful evening'],
-                'night': ['nighttime peace', 'quiet moments', 'restful thoughts']
+                'morning': ('starting fresh', 'new beginning', 'morning energy', 'dawn of possibility'),
+                'afternoon': ('midday reflection', 'afternoon thoughts', 'continuing journey'),
+                'evening': ('evening contemplation', 'day reflection', 'peaceful evening'),
+                'night': ('nighttime peace', 'quiet moments', 'restful thoughts')
             }
         }
     
@@ -145,32 +200,126 @@ class TemplateVariationEngine:
         Generate a contextual variation of the template
         """
         try:
-            # Get the base variation using rotation
-            base_variation = self._get_rotated_variation(template, context.user_name)
-            
-            # Apply contextual enhancements
-            enhanced_variation = self._apply_contextual_enhancements(
-                base_variation, template, context
-            )
-            
-            # Apply personality modifications
-            personality_enhanced = self._apply_personality_modifications(
-                enhanced_variation, template.personality_tone, context
-            )
-            
-            # Fill in placeholders
-            final_variation = self._fill_placeholders(personality_enhanced, context)
-            
-            logger.debug(f"Generated variation for template {template.id}: {final_variation[:50]}...")
-            return final_variation
-            
+            final_variation = self._render(template, context)
         except Exception as e:
             logger.error(f"Error generating variation for template {template.id}: {e}")
             # Fallback to base template with basic placeholder filling
             return self._fill_placeholders(template.base_template, context)
+        
+        # Skip building the message when debug logging is off
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Generated variation for template {template.id}: {final_variation[:50]}...")
+        return final_variation
+    
+    def _render(self, template: ConversationTemplate, context: VariationContext) -> str:
+        """
+        Rotated variation with contextual enhancements and personality modifications
+        applied and placeholders filled. Both enhancement stages are inlined here,
+        with the generator and context fields bound to locals, since this runs for
+        every templated reply.
+        """
+        rand = self._rng.random
+        choice = self._rng.choice
+        
+        # Get the base variation using rotation
+        variation = self._get_rotated_variation(template, context.user_name)
+        suffix = ''
+        
+        # Add memory references if appropriate
+        recent_memories = context.recent_memories
+        if recent_memories and rand() < 0.3:  # 30% chance
+            memory_ref = self._memory_refs[int(rand() * self._memory_refs_n)]
+            memory_phrase = memory_ref.format(memory=choice(recent_memories))
+            suffix = f"{suffix} {memory_phrase}."
+        
+        # Add friend references if appropriate
+        friend_names = context.friend_names
+        if (friend_names and 
+            template.conversation_type.value in ['casual_chat', 'memory_recall'] and
+            rand() < 0.25):  # 25% chance
+            friend_ref = self._friend_refs[int(rand() * self._friend_refs_n)]
+            friend_phrase = friend_ref.format(friend_name=choice(friend_names))
+            suffix = f"{suffix} {friend_phrase}"
+        
+        # Add time-contextual elements
+        time_of_day = context.time_of_day
+        today_repl = None
+        if time_of_day and time_of_day in self.contextual_enhancers['time_contextual']:
+            time_elements = self.contextual_enhancers['time_contextual'][time_of_day]
+            if rand() < 0.2:  # 20% chance
+                time_element = choice(time_elements)
+                today_repl = _TODAY_REPL[time_of_day]
+        
+        # Apply personality modifications: pick a prebuilt decoration of the variation
+        tone = template.personality_tone
+        modifiers = self._tone_modifiers.get(tone)
+        if modifiers is not None:
+            phrases, adjectives = modifiers
+            table = self._preassembled.get((variation, tone))
+            if table is None:
+                table = self._personality_table(variation, tone)
+            
+            # Occasionally add personality-specific phrases
+            row = 0
+            if rand() < 0.3:  # 30% chance
+                row = 1 + int(rand() * len(phrases))
+            
+            # Replace generic words with personality-specific ones
+            column = 0
+            if rand() < 0.4:  # 40% chance
+                # Replace "good" with personality-specific adjectives
+                if len(table[row]) > 1:
+                    column = 1 + int(rand() * len(adjectives))
+            
+            variation = table[row][column]
+        
+        enhanced = variation + suffix
+        if today_repl and 'today' in enhanced:
+            enhanced = enhanced.replace('today', today_repl)
+        
+        # Fill in placeholders; a memory/friend suffix makes the text unique to this user,
+        # so it is parsed without going through (and churning) the template cache
+        return self._fill_placeholders(enhanced, context, cache=not suffix)
+    
+    def _personality_table(self, variation: str, tone: PersonalityTone) -> Tuple[Tuple[str, ...], ...]:
+        """
+        Every personality decoration of a variation, built once per (variation, tone).
+        Row 0 is the plain text and row i the text with phrase i-1 inserted before the
+        first period; within a row, column 0 is unchanged and column j has "good"
+        replaced by adjective j-1. Rows without "good" have only column 0.
+        """
+        phrases, adjectives = self._tone_modifiers[tone]
+        
+        # Insert phrase naturally, before the first period; found once for every phrase
+        dot = variation.find('.')
+        if dot < 0:
+            rows = [variation] * (len(phrases) + 1)
+        else:
+            head, tail = variation[:dot], variation[dot:]
+            rows = [variation] + [f"{head} {phrase}{tail}" for phrase in phrases]
+        
+        table = tuple(
+            (row,) + tuple(_GOOD_RE.sub(adjective, row) for adjective in adjectives)
+            if 'good' in row.lower() else (row,)
+            for row in rows
+        )
+        self._preassembled[(variation, tone)] = table
+        return table
+    
+    def precompile(self, templates: Iterable[ConversationTemplate]):
+        """Build the personality tables for every variation of the given templates up front"""
+        for template in templates:
+            if template.personality_tone in self._tone_modifiers:
+                for variation in {template.base_template, *template.variations}:
+                    if (variation, template.personality_tone) not in self._preassembled:
+                        self._personality_table(variation, template.personality_tone)
     
     def _get_rotated_variation(self, template: ConversationTemplate, user_id: str) -> str:
         """Get next variation using rotation algorithm"""
+        if template._single_text:
+            # Nothing to rotate between; don't keep rotation state for it
+            return template.base_template
+        
         rotation_state = self._get_rotation_state(user_id, template.id)
         
         # Determine available variations
@@ -185,10 +334,8 @@ class TemplateVariationEngine:
             self._reset_rotation_state(rotation_state)
         
         # Find unused variations
-        unused_indices = [
-            i for i in range(len(available_variations))
-            if i not in rotation_state.used_variations
-        ]
+        used = rotation_state.used_variations
+        unused_indices = [i for i in range(len(available_variations)) if i not in used]
         
         if not unused_indices:
             # Fallback: reset and use any variation
@@ -199,108 +346,66 @@ class TemplateVariationEngine:
         selected_index = self._select_variation_index(unused_indices, rotation_state)
         
         # Update rotation state
-        rotation_state.used_variations.append(selected_index)
+        rotation_state.used_variations.add(selected_index)
         rotation_state.last_used_index = selected_index
         rotation_state.rotation_count += 1
         
         return available_variations[selected_index]
     
-    def _apply_contextual_enhancements(self, variation: str, template: ConversationTemplate,
-                                     context: VariationContext) -> str:
-        """Apply context-specific enhancements to the variation"""
-        enhanced = variation
-        
-        # Add memory references if appropriate
-        if context.recent_memories and random.random() < 0.3:  # 30% chance
-            memory_ref = random.choice(self.contextual_enhancers['memory_references'])
-            memory = random.choice(context.recent_memories)
-            memory_phrase = memory_ref.format(memory=memory)
-            enhanced = f"{enhanced} {memory_phrase}."
-        
-        # Add friend references if appropriate
-        if (context.friend_names and 
-            template.conversation_type.value in ['casual_chat', 'memory_recall'] and
-            random.random() < 0.25):  # 25% chance
-            friend_ref = random.choice(self.contextual_enhancers['friend_references'])
-            friend = random.choice(context.friend_names)
-            friend_phrase = friend_ref.format(friend_name=friend)
-            enhanced = f"{enhanced} {friend_phrase}"
-        
-        # Add time-contextual elements
-        if context.time_of_day and context.time_of_day in self.contextual_enhancers['time_contextual']:
-            time_elements = self.contextual_enhancers['time_contextual'][context.time_of_day]
-            if random.random() < 0.2:  # 20% chance
-                time_element = random.choice(time_elements)
-                enhanced = enhanced.replace('today', f'this {context.time_of_day}')
-        
-        return enhanced
-    
-    def _apply_personality_modifications(self, variation: str, personality_tone: PersonalityTone,
-                                       context: VariationContext) -> str:
-        """Apply personality-specific modifications"""
-        if personality_tone not in self.personality_modifiers:
-            return variation
-        
-        modifiers = self.personality_modifiers[personality_tone]
-        modified = variation
-        
-        # Occasionally add personality-specific phrases
-        if random.random() < 0.3:  # 30% chance
-            phrase = random.choice(modifiers['phrases'])
-            # Insert phrase naturally
-            if '.' in modified:
-                parts = modified.split('.', 1)
-                modified = f"{parts[0]} {phrase}.{parts[1] if len(parts) > 1 else ''}"
-        
-        # Replace generic words with personality-specific ones
-        if random.random() < 0.4:  # 40% chance
-            # Replace "good" with personality-specific adjectives
-            if 'good' in modified.lower():
-                replacement = random.choice(modifiers['adjectives'])
-                modified = re.sub(r'\bgood\b', replacement, modified, flags=re.IGNORECASE)
-        
-        return modified
-    
-    def _fill_placeholders(self, variation: str, context: VariationContext) -> str:
+    def _fill_placeholders(self, variation: str, context: VariationContext, cache: bool = True) -> str:
         """Fill in placeholders with context information"""
-        filled = variation
+        compile_template = _compile_template if cache else _compile_template.__wrapped__
+        segments, names = compile_template(variation)
+        if not names:
+            # Nothing to fill; only the whitespace clean-up applies
+            return ' '.join(variation.split())
         
         # Basic placeholder filling
-        filled = filled.replace('{user_name}', context.user_name)
+        values = {'user_name': context.user_name}
         
         # Fill friend name if present
-        if '{friend_name}' in filled and context.friend_names:
-            friend_name = random.choice(context.friend_names)
-            filled = filled.replace('{friend_name}', friend_name)
+        if 'friend_name' in names and context.friend_names:
+            values['friend_name'] = self._rng.choice(context.friend_names)
         
         # Fill memory if present
-        if '{memory}' in filled and context.recent_memories:
-            memory = random.choice(context.recent_memories)
-            filled = filled.replace('{memory}', memory)
+        if 'memory' in names and context.recent_memories:
+            values['memory'] = self._rng.choice(context.recent_memories)
         
-        # Remove any unfilled placeholders gracefully
-        filled = re.sub(r'\{[^}]+\}', '', filled)
+        # Unfilled placeholders render as nothing
+        filled = ''.join([
+            literal if name is None else values.get(name, '')
+            for literal, name in segments
+        ])
         
         # Clean up extra spaces
-        filled = re.sub(r'\s+', ' ', filled).strip()
-        
-        return filled
+        return ' '.join(filled.split())
     
     def _get_rotation_state(self, user_id: str, template_id: str) -> RotationState:
-        """Get or create rotation state for user and template"""
-        if user_id not in self.rotation_states:
-            self.rotation_states[user_id] = {}
-        
-        if template_id not in self.rotation_states[user_id]:
-            self.rotation_states[user_id][template_id] = RotationState(template_id=template_id)
-        
-        return self.rotation_states[user_id][template_id]
+        """Get or create rotation state for user and template, evicting the least recently used when full"""
+        with self._states_lock:
+            user_states = self.rotation_states.get(user_id)
+            if user_states is None:
+                user_states = self.rotation_states[user_id] = OrderedDict()
+                if len(self.rotation_states) > self.max_users:
+                    evicted_id, _ = self.rotation_states.popitem(last=False)
+                    logger.debug(f"Evicted variation rotation states for user: {evicted_id}")
+            else:
+                self.rotation_states.move_to_end(user_id)
+            
+            state = user_states.get(template_id)
+            if state is None:
+                state = user_states[template_id] = RotationState(template_id=template_id)
+                if len(user_states) > self.max_templates_per_user:
+                    user_states.popitem(last=False)
+            else:
+                user_states.move_to_end(template_id)
+            
+            return state
     
     def _should_reset_rotation(self, rotation_state: RotationState) -> bool:
         """Determine if rotation should be reset"""
         # Reset after 24 hours
-        time_threshold = datetime.now() - timedelta(hours=24)
-        if rotation_state.last_reset < time_threshold:
+        if time.monotonic() - rotation_state.last_reset_ts > ROTATION_RESET_SECONDS:
             return True
         
         # Reset after many rotations to prevent predictability
@@ -314,7 +419,7 @@ class TemplateVariationEngine:
         rotation_state.used_variations.clear()
         rotation_state.last_used_index = -1
         rotation_state.rotation_count = 0
-        rotation_state.last_reset = datetime.now()
+        rotation_state.last_reset_ts = time.monotonic()
     
     def _select_variation_index(self, unused_indices: List[int], 
                                rotation_state: RotationState) -> int:
@@ -326,9 +431,9 @@ class TemplateVariationEngine:
         if rotation_state.last_used_index in unused_indices and len(unused_indices) > 1:
             available = [idx for idx in unused_indices if idx != rotation_state.last_used_index]
             if available:
-                return random.choice(available)
+                return self._rng.choice(available)
         
-        return random.choice(unused_indices)
+        return self._rng.choice(unused_indices)
     
     def generate_follow_up_question(self, template: ConversationTemplate,
                                    context: VariationContext) -> Optional[str]:
@@ -336,8 +441,12 @@ class TemplateVariationEngine:
         if not template.follow_up_questions:
             return None
         
-        # Select follow-up question with some variation
-        base_question = random.choice(template.follow_up_questions)
+        # Cycle through the follow-ups so the same question doesn't come up twice in a row
+        follow_ups = template.follow_up_questions
+        rotation_state = self._get_rotation_state(context.user_name, template.id)
+        index = rotation_state.follow_up_index % len(follow_ups)
+        rotation_state.follow_up_index = index + 1
+        base_question = follow_ups[index]
         
         # Apply contextual modifications
         enhanced_question = self._enhance_follow_up_question(base_question, context)
@@ -351,48 +460,40 @@ class TemplateVariationEngine:
         # Add conversation length awareness
         if context.conversation_length > 5:
             # Make questions more specific in longer conversations
-            if 'how' in enhanced.lower() and random.random() < 0.3:
+            if 'how' in enhanced.lower() and self._rng.random() < 0.3:
                 enhanced = enhanced.replace('How', 'In what specific way')
         
         # Add time context
-        if context.time_of_day == 'evening' and 'today' in enhanced:
-            enhanced = enhanced.replace('today', 'this evening')
-        elif context.time_of_day == 'morning' and 'today' in enhanced:
-            enhanced = enhanced.replace('today', 'this morning')
+        today_repl = _FOLLOW_UP_TODAY_REPL.get(context.time_of_day)
+        if today_repl and 'today' in enhanced:
+            enhanced = enhanced.replace('today', today_repl)
         
         return enhanced
     
     def get_variation_stats(self, user_id: str) -> Dict[str, any]:
         """Get variation statistics for a user"""
-        if user_id not in self.rotation_states:
+        with self._states_lock:
+            user_states = self.rotation_states.get(user_id)
+            states = tuple(user_states.items()) if user_states else ()
+        if not states:
             return {'total_templates': 0, 'rotation_states': {}}
         
-        user_states = self.rotation_states[user_id]
-        stats = {
-            'total_templates': len(user_states),
-            'rotation_states': {},
-            'total_rotations': 0,
-            'avg_variations_per_template': 0
+        wall_offset = self._wall_offset
+        total_variations = sum(len(state.used_variations) for _, state in states)
+        return {
+            'total_templates': len(states),
+            'rotation_states': {
+                template_id: {
+                    'rotation_count': state.rotation_count,
+                    'used_variations': len(state.used_variations),
+                    'last_reset': datetime.fromtimestamp(state.last_reset_ts + wall_offset).isoformat(),
+                    'last_used_index': state.last_used_index
+                }
+                for template_id, state in states
+            },
+            'total_rotations': sum(state.rotation_count for _, state in states),
+            'avg_variations_per_template': total_variations / len(states)
         }
-        
-        total_rotations = 0
-        total_variations = 0
-        
-        for template_id, state in user_states.items():
-            stats['rotation_states'][template_id] = {
-                'rotation_count': state.rotation_count,
-                'used_variations': len(state.used_variations),
-                'last_reset': state.last_reset.isoformat(),
-                'last_used_index': state.last_used_index
-            }
-            total_rotations += state.rotation_count
-            total_variations += len(state.used_variations)
-        
-        stats['total_rotations'] = total_rotations
-        if len(user_states) > 0:
-            stats['avg_variations_per_template'] = total_variations / len(user_states)
-        
-        return stats
     
     def reset_user_rotations(self, user_id: str):
         """Reset all rotation states for a user"""
@@ -403,10 +504,16 @@ class TemplateVariationEngine:
 
 # Global variation engine instance
 _variation_engine = None
+_variation_engine_lock = threading.Lock()
 
 def get_variation_engine() -> TemplateVariationEngine:
     """Get global variation engine instance"""
     global _variation_engine
-    if _variation_engine is None:
-        _variation_engine = TemplateVariationEngine()
-    return _variation_engine
\ No newline at end of file
+    engine = _variation_engine
+    if engine is None:
+        # Double-checked so only first calls take the lock and racing ones build it once
+        with _variation_engine_lock:
+            engine = _variation_engine
+            if engine is None:
+                engine = _variation_engine = TemplateVariationEngine()
+    return engine
\ No newline at end of file
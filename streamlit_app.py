@@ -2,6 +2,7 @@
 streamlit_app.py - Modular Streamlit UI with Login/Register
 """
 
+import html
 import streamlit as st
 from chatbot import JumboChatbot
 from language_utils import Language
@@ -63,26 +64,54 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Chat bubble markup; message contents are stored via bubble_text
+USER_BUBBLE = '<div class="user-message"><b>You:</b> %s</div>'
+BOT_BUBBLE = '<div class="bot-message"><b>😊 Jumbo:</b> %s</div>'
+
+def bubble_text(text):
+    """
+    Message text made safe to drop into a bubble: HTML-escaped, with backticks/tildes
+    as entities and line breaks as <br>, so a code fence or blank line in one message
+    cannot end the HTML block and change how the rest of the history renders
+    """
+    text = html.escape(text, quote=False).replace("`", "&#96;").replace("~", "&#126;")
+    return "<br>".join(text.splitlines())
+
 # ============================================================================
 # SESSION STATE INITIALIZATION
 # ============================================================================
 
-if 'chatbot' not in st.session_state:
-    st.session_state.chatbot = JumboChatbot()
+ss = st.session_state
 
-if 'user_registered' not in st.session_state:
-    st.session_state.user_registered = False
+# Built only on the first run; setdefault would construct a chatbot every rerun
+if 'chatbot' not in ss:
+    ss.chatbot = JumboChatbot()
 
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+for key, default in (
+    ('user_registered', False),
+    ('messages', []),
+    ('current_user', None),
+    ('auth_mode', "login"),  # "login" or "register"
+    ('user_exists_cache', {}),  # name -> chatbot.user_exists() result for this session
+    ('last_response', None),  # metadata of the latest reply, shown in the chat sidebar
+):
+    ss.setdefault(key, default)
 
-if 'current_user' not in st.session_state:
-    st.session_state.current_user = None
+chatbot = ss.chatbot
 
-if 'auth_mode' not in st.session_state:
-    st.session_state.auth_mode = "login"  # "login" or "register"
+def _user_exists(name):
+    """chatbot.user_exists, remembered per session so retries don't hit storage again"""
+    cache = st.session_state.user_exists_cache
+    exists = cache.get(name)
+    if exists is None:
+        exists = cache[name] = chatbot.user_exists(name)
+    return exists
 
-chatbot = st.session_state.chatbot
+@st.cache_data
+def _load_jumbo_png():
+    """Sidebar/header image bytes, read from disk once per server process"""
+    with open("assets/newjumbo.png", "rb") as f:
+        return f.read()
 
 # ============================================================================
 # SIDEBAR - LOGIN / REGISTER
@@ -90,13 +119,15 @@ chatbot = st.session_state.chatbot
 
 def display_auth_sidebar():
     """Display login/register interface"""
+    ss = st.session_state
+    auth_mode = ss.auth_mode
     with st.sidebar:
         # Display sidebar image - SMALL SIZE (120px)
         try:
             col = st.columns([1])[0]
             with col:
-                st.image("assets/newjumbo.png", width=120)
-        except:
+                st.image(_load_jumbo_png(), width=120)
+        except FileNotFoundError:
             pass
         
         st.markdown("## 🐘 Jumbo Chatbot")
@@ -107,21 +138,21 @@ def display_auth_sidebar():
         with col1:
             if st.button("🔑 Login", use_container_width=True, 
                         key="login_btn",
-                        type="primary" if st.session_state.auth_mode == "login" else "secondary"):
-                st.session_state.auth_mode = "login"
+                        type="primary" if auth_mode == "login" else "secondary"):
+                ss.auth_mode = "login"
                 st.rerun()
         
         with col2:
             if st.button("✍️ Register", use_container_width=True,
                         key="register_btn",
-                        type="primary" if st.session_state.auth_mode == "register" else "secondary"):
-                st.session_state.auth_mode = "register"
+                        type="primary" if auth_mode == "register" else "secondary"):
+                ss.auth_mode = "register"
                 st.rerun()
         
         st.divider()
         
         # LOGIN MODE
-        if st.session_state.auth_mode == "login":
+        if auth_mode == "login":
             st.markdown("### 🔓 Login")
             st.write("Enter your name to continue chatting.")
             
@@ -140,13 +171,13 @@ def display_auth_sidebar():
                         st.error("Name must be at least 2 characters long.")
                     else:
                         # Check if user exists
-                        if not chatbot.user_exists(login_name):
+                        if not _user_exists(login_name):
                             st.error(f"❌ User '{login_name}' not found. Please register first.")
                         else:
                             # Login user
                             chatbot.set_current_user(login_name, "te")
-                            st.session_state.user_registered = True
-                            st.session_state.current_user = login_name
+                            ss.user_registered = True
+                            ss.current_user = login_name
                             st.success(f"✅ Welcome back, {login_name}!")
                             st.rerun()
         
@@ -170,14 +201,15 @@ def display_auth_sidebar():
                         st.error("Name must be at least 2 characters long.")
                     else:
                         # Check if name already exists
-                        if chatbot.user_exists(register_name):
+                        if _user_exists(register_name):
                             st.error(f"❌ '{register_name}' is already taken. Please choose a different name.")
                         else:
                             # Register new user
                             success, message = chatbot.register_new_user(register_name, "te")
                             if success:
-                                st.session_state.user_registered = True
-                                st.session_state.current_user = register_name
+                                ss.user_exists_cache[register_name] = True
+                                ss.user_registered = True
+                                ss.current_user = register_name
                                 st.success(f"✅ {message}")
                                 st.rerun()
                             else:
@@ -185,11 +217,12 @@ def display_auth_sidebar():
 
 def display_chat_sidebar():
     """Display sidebar when user is logged in"""
+    ss = st.session_state
     with st.sidebar:
         # Display sidebar image - smaller size
         try:
-            st.image("assets/newjumbo.png", use_container_width=True)
-        except:
+            st.image(_load_jumbo_png(), use_container_width=True)
+        except FileNotFoundError:
             pass
         
         # User is registered
@@ -219,17 +252,87 @@ def display_chat_sidebar():
             
             # Logout
             if st.button("🚪 Logout", use_container_width=True):
-                st.session_state.user_registered = False
-                st.session_state.current_user = None
-                st.session_state.messages = []
-                st.session_state.auth_mode = "login"
+                ss.user_registered = False
+                ss.current_user = None
+                ss.messages = []
+                ss.last_response = None
+                ss.auth_mode = "login"
                 st.rerun()
+        
+        # Metadata of the latest reply (the chat fragment can't write to the sidebar itself)
+        metadata = ss.last_response
+        if metadata:
+            st.markdown("### 📊 Last Response")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Mood", metadata.get("mood", "neutral"))
+            with col2:
+                confidence = metadata.get("mood_confidence", 0)
+                st.metric("Confidence", f"{confidence:.0%}")
+            
+            if metadata.get("response_type"):
+                st.caption(f"Type: {metadata.get('response_type')}")
+            
+            if metadata.get("used_llm"):
+                st.caption("🤖 LLM Response")
+            
+            st.caption(f"Language: {metadata.get('detected_language')}")
+
+@st.fragment
+def display_chat():
+    """Chat history and input; sending a message reruns only this fragment"""
+    ss = st.session_state
+    chat_container = st.container()
+    
+    # Whole history as one markdown element instead of one per message
+    with chat_container:
+        if ss.messages:
+            st.markdown("".join(
+                (USER_BUBBLE if message["role"] == "user" else BOT_BUBBLE) % message["content"]
+                for message in ss.messages
+            ), unsafe_allow_html=True)
+    
+    st.divider()
+    
+    # Input area - MUST be outside columns/sidebar
+    user_input = st.chat_input(
+        "Type your message in Telugu, Hindi, or English...",
+        key="chat_input"
+    )
+    
+    # Process user input
+    if user_input:
+        # Add user message to history; contents are stored ready to render
+        ss.messages.append({
+            "role": "user",
+            "content": bubble_text(user_input)
+        })
+        
+        # Get chatbot response
+        with st.spinner("Jumbo is thinking..."):
+            try:
+                response, metadata = chatbot.process_message(user_input)
+                
+                # Add bot response to history
+                ss.messages.append({
+                    "role": "assistant",
+                    "content": bubble_text(response)
+                })
+                
+                # Shown in the sidebar on the next full rerun
+                ss.last_response = metadata
+                
+                st.rerun(scope="fragment")
+            
+            except Exception as e:
+                st.error(f"Error processing message: {str(e)}")
+                ss.messages.pop()  # Remove failed message
 
 # ============================================================================
 # MAIN CHAT AREA
 # ============================================================================
 
-if not st.session_state.user_registered:
+if not ss.user_registered:
     # Show auth sidebar
     display_auth_sidebar()
     
@@ -289,89 +392,14 @@ else:
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         try:
-            st.image("assets/newjumbo.png", use_container_width=True)
-        except:
-            pass
-    
-    
-    # Display small Jumbo image at top
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        try:
-            st.image("assets/newjumbo.png", use_container_width=True)
-        except:
+            st.image(_load_jumbo_png(), use_container_width=True)
+        except FileNotFoundError:
             pass
     
     st.markdown(f"# 🐘 Chat with Jumbo")
-    st.markdown(f"_Chatting as **{st.session_state.current_user}**_")
+    st.markdown(f"_Chatting as **{ss.current_user}**_")
     
-    chat_container = st.container()
-    
-    with chat_container:
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-message">
-                    <b>You:</b> {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="bot-message">
-                    <b>😊 Jumbo:</b> {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-    
-    st.divider()
-    
-    # Input area - MUST be outside columns/sidebar
-    user_input = st.chat_input(
-        "Type your message in Telugu, Hindi, or English...",
-        key="chat_input"
-    )
-    
-    # Process user input
-    if user_input:
-        # Add user message to history
-        st.session_state.messages.append({
-            "role": "user",
-            "content": user_input
-        })
-        
-        # Get chatbot response
-        with st.spinner("Jumbo is thinking..."):
-            try:
-                response, metadata = chatbot.process_message(user_input)
-                
-                # Add bot response to history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-                # Display metadata in sidebar
-                with st.sidebar:
-                    st.markdown("### 📊 Last Response")
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("Mood", metadata.get("mood", "neutral"))
-                    with col2:
-                        confidence = metadata.get("mood_confidence", 0)
-                        st.metric("Confidence", f"{confidence:.0%}")
-                    
-                    if metadata.get("response_type"):
-                        st.caption(f"Type: {metadata.get('response_type')}")
-                    
-                    if metadata.get("used_llm"):
-                        st.caption("🤖 LLM Response")
-                    
-                    st.caption(f"Language: {metadata.get('detected_language')}")
-                
-                st.rerun()
-            
-            except Exception as e:
-                st.error(f"Error processing message: {str(e)}")
-                st.session_state.messages.pop()  # Remove failed message
+    display_chat()
 
 # ============================================================================
 # FOOTER
@@ -201,6 +201,11 @@ CREATE INDEX IF NOT EXISTS idx_memories_updated ON user_memories(user_id, update
 CREATE INDEX IF NOT EXISTS idx_memories_fact_search ON user_memories USING gin(to_tsvector('english', fact)) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_memories_name_search ON user_memories USING gin(to_tsvector('english', name)) WHERE is_active = true AND name IS NOT NULL;
 
+-- Substring search indexes (search_user_memories ilike filters)
+CREATE INDEX IF NOT EXISTS idx_memories_fact_trgm ON user_memories USING gin(fact gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_memories_name_trgm ON user_memories USING gin(name gin_trgm_ops) WHERE name IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_memories_category_trgm ON user_memories USING gin(category gin_trgm_ops) WHERE category IS NOT NULL;
+
 -- Mood history indexes
 CREATE INDEX IF NOT EXISTS idx_mood_history_user_date ON mood_history(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_mood_history_mood ON mood_history(user_id, mood);
@@ -363,6 +368,21 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Function to get conversation stats in one round trip
+-- (runs with the caller's rights, so conversations RLS still applies)
+CREATE OR REPLACE FUNCTION get_user_stats(p_user_id UUID)
+RETURNS TABLE(
+  total_conversations BIGINT,
+  first_conversation TIMESTAMPTZ
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT COUNT(*), MIN(c.created_at)
+  FROM conversations c
+  WHERE c.user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
 -- ============================================
 -- ENHANCED VIEWS FOR MONITORING
 -- ============================================
@@ -4,15 +4,118 @@ Handles authentication and data storage using Supabase
 Matches the provided database schema exactly
 """
 
+import atexit
 import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from typing import Dict, List, Optional, Tuple, Any
-from supabase import create_client, Client
-from datetime import datetime
+import httpx
+from postgrest import ReturnMethod
+from supabase import create_client, Client, ClientOptions
+from datetime import datetime, timedelta
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Per-client HTTP pool, kept under the Supabase session pooler's connection limit;
+# idle sockets are dropped after HTTP_KEEPALIVE_EXPIRY seconds instead of going stale
+HTTP_MAX_CONNECTIONS = 10
+HTTP_MAX_KEEPALIVE = 5
+HTTP_KEEPALIVE_EXPIRY = 30
+HTTP_RETRIES = 2
+HTTP_TIMEOUT = 120  # matches postgrest's default request timeout
+
+# Columns get_user_conversations maps into its result dicts
+CONVERSATION_COLUMNS = "id,user_message,bot_response,mood,mood_confidence,detected_language,used_llm,scenario,metadata,created_at"
+
+# Profiles read in the last PROFILE_CACHE_TTL seconds are served from memory
+PROFILE_CACHE_SIZE = 1024
+PROFILE_CACHE_TTL = 30
+
+# Background mood-history writes: rows per bulk insert, and how long to wait for more
+MOOD_BATCH_SIZE = 50
+MOOD_BATCH_WAIT = 0.1
+# Seconds to wait at exit for queued mood-history rows to be written
+MOOD_FLUSH_TIMEOUT = 10
+# Conversations only add a mood_history row for a non-neutral mood detected at least this confidently
+MOOD_HISTORY_MIN_CONFIDENCE = 0.3
+
+@cache
+def _get_client(url: str, key: str) -> Client:
+    """
+    One Supabase client per (url, key) for the whole process, so every
+    SupabaseService reuses the same HTTP sessions and connection pools
+    """
+    transport = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        retries=HTTP_RETRIES,  # connect failures only; requests are never replayed
+        http2=True
+    )
+    http_client = httpx.Client(transport=transport, timeout=HTTP_TIMEOUT, follow_redirects=True)
+    return create_client(url, key, options=ClientOptions(httpx_client=http_client))
+
+@cache
+def _get_mood_queue(client: Client) -> "queue.Queue[Optional[Dict]]":
+    """
+    Queue of mood_history rows for client, drained off the request path by one
+    writer thread per client for the whole process; flushed at interpreter exit
+    """
+    mood_queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+    writer = threading.Thread(target=_mood_writer, args=(client, mood_queue),
+                              name="mood-history-writer", daemon=True)
+    writer.start()
+    
+    def flush():
+        mood_queue.put(None)
+        writer.join(MOOD_FLUSH_TIMEOUT)
+        if writer.is_alive():
+            logger.warning("Mood history writer still busy at exit, queued rows may be lost")
+    
+    atexit.register(flush)
+    return mood_queue
+
+def _mood_writer(client: Client, mood_queue: "queue.Queue[Optional[Dict]]"):
+    """Bulk-insert whatever rows arrive together, until the None sentinel from flush"""
+    done = False
+    while not done:
+        rows = [mood_queue.get()]
+        try:
+            while len(rows) < MOOD_BATCH_SIZE and rows[-1] is not None:
+                rows.append(mood_queue.get(timeout=MOOD_BATCH_WAIT))
+        except queue.Empty:
+            pass
+        
+        if rows[-1] is None:
+            rows.pop()
+            done = True
+        if not rows:
+            continue
+        
+        try:
+            client.table('mood_history').insert(rows, returning=ReturnMethod.minimal).execute()
+        except Exception as e:
+            logger.error("Save mood history error (%d rows dropped): %s", len(rows), e)
+
+def _ilike_pattern(term: str) -> str:
+    """
+    Quoted PostgREST ilike value matching term anywhere in a column.
+    LIKE wildcards in the term are escaped so it matches literally, and the
+    double quotes keep commas, dots and parentheses out of the or_() syntax.
+    """
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    escaped = escaped.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"*{escaped}*"'
+
 class SupabaseService:
     def __init__(self):
         """Initialize Supabase client"""
@@ -23,16 +126,23 @@ class SupabaseService:
         if not self.url or not self.key:
             raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment variables")
         
-        self.supabase: Client = create_client(self.url, self.key)
+        self.supabase: Client = _get_client(self.url, self.key)
         
         # Service role client for admin operations
         if self.service_key:
-            self.admin_client: Client = create_client(self.url, self.service_key)
+            self.admin_client: Client = _get_client(self.url, self.service_key)
         else:
             self.admin_client = self.supabase
             logger.warning("SUPABASE_SERVICE_ROLE_KEY not set, using anon key for admin operations")
         
         self.current_user_id = None
+        
+        # user_id -> (expiry, profile), least recently used first; dropped on every profile write
+        self._profile_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._profile_lock = threading.Lock()
+        
+        # Mood history rows written in the background; admin client bypasses RLS
+        self._mood_queue = _get_mood_queue(self.admin_client)
 
     # ==================== AUTHENTICATION ====================
     
@@ -57,7 +167,7 @@ class SupabaseService:
                 return False, "Failed to create user", {}
                 
         except Exception as e:
-            logger.error(f"Sign up error: {e}")
+            logger.error("Sign up error: %s", e)
             return False, str(e), {}
 
     def sign_in(self, email: str, password: str) -> Tuple[bool, str, Dict]:
@@ -79,7 +189,7 @@ class SupabaseService:
                 return False, "Invalid credentials", {}
                 
         except Exception as e:
-            logger.error(f"Sign in error: {e}")
+            logger.error("Sign in error: %s", e)
             return False, str(e), {}
 
     def sign_out(self) -> Tuple[bool, str]:
@@ -88,7 +198,7 @@ class SupabaseService:
             self.supabase.auth.sign_out()
             return True, "Signed out successfully"
         except Exception as e:
-            logger.error(f"Sign out error: {e}")
+            logger.error("Sign out error: %s", e)
             return False, str(e)
 
     def get_current_user(self) -> Optional[Dict]:
@@ -104,7 +214,7 @@ class SupabaseService:
                 }
             return None
         except Exception as e:
-            logger.error(f"Get user error: {e}")
+            logger.error("Get user error: %s", e)
             return None
     
     def get_current_user_from_token(self, access_token: str) -> Optional[Dict]:
@@ -122,7 +232,7 @@ class SupabaseService:
                 }
             return None
         except Exception as e:
-            logger.error(f"Get user from token error: {e}")
+            logger.error("Get user from token error: %s", e)
             return None
 
     # ==================== USER PROFILES ====================
@@ -131,13 +241,13 @@ class SupabaseService:
         """Create user profile in profiles table"""
         try:
             data = {
-                "id": user_id,  # Use 'id' not 'user_id' to match schema
-                "created_at": datetime.utcnow().isoformat(),
+                "id": user_id,  # Use 'id' not 'user_id' to match schema; created_at defaults to now()
                 **profile_data
             }
             
             # Use admin client to bypass RLS for profile creation
             response = self.admin_client.table('profiles').insert(data).execute()
+            self._forget_profile(user_id)
             
             if response.data:
                 return True, "Profile created successfully"
@@ -145,28 +255,48 @@ class SupabaseService:
                 return False, "Failed to create profile"
                 
         except Exception as e:
-            logger.error(f"Create profile error: {e}")
+            logger.error("Create profile error: %s", e)
             return False, str(e)
 
     def get_user_profile(self, user_id: str) -> Optional[Dict]:
         """Get user profile by user_id"""
+        now = time.monotonic()
+        with self._profile_lock:
+            cached = self._profile_cache.get(user_id)
+            if cached is not None and cached[0] > now:
+                self._profile_cache.move_to_end(user_id)
+                return cached[1]
+        
         try:
             # Use admin client to bypass RLS for profile reading in backend operations
-            response = self.admin_client.table('profiles').select("*").eq('id', user_id).execute()
-            
-            if response.data and len(response.data) > 0:
-                return response.data[0]
+            # maybe_single returns the row as an object, or None when there is no profile
+            response = self.admin_client.table('profiles').select("*").eq('id', user_id).maybe_single().execute()
+            
+            if response is not None and response.data:
+                profile = response.data
+                with self._profile_lock:
+                    self._profile_cache[user_id] = (now + PROFILE_CACHE_TTL, profile)
+                    self._profile_cache.move_to_end(user_id)
+                    if len(self._profile_cache) > PROFILE_CACHE_SIZE:
+                        self._profile_cache.popitem(last=False)
+                return profile
             return None
             
         except Exception as e:
-            logger.error(f"Get profile error: {e}")
+            logger.error("Get profile error: %s", e)
             return None
 
+    def _forget_profile(self, user_id: str):
+        """Drop a cached profile after writing to it"""
+        with self._profile_lock:
+            self._profile_cache.pop(user_id, None)
+
     def update_user_profile(self, user_id: str, updates: Dict) -> Tuple[bool, str]:
         """Update user profile"""
         try:
             # Use admin client to bypass RLS for profile updates
             response = self.admin_client.table('profiles').update(updates).eq('id', user_id).execute()
+            self._forget_profile(user_id)
             
             if response.data:
                 return True, "Profile updated successfully"
@@ -174,7 +304,7 @@ class SupabaseService:
                 return False, "Failed to update profile"
                 
         except Exception as e:
-            logger.error(f"Update profile error: {e}")
+            logger.error("Update profile error: %s", e)
             return False, str(e)
 
     def set_preferred_name(self, user_id: str, preferred_name: str) -> Tuple[bool, str]:
@@ -184,6 +314,7 @@ class SupabaseService:
                        .update({'preferred_name': preferred_name})
                        .eq('id', user_id)
                        .execute())
+            self._forget_profile(user_id)
             
             if response.data:
                 return True, f"Great! I'll call you {preferred_name} from now on."
@@ -191,7 +322,7 @@ class SupabaseService:
                 return False, "Failed to save your preferred name"
                 
         except Exception as e:
-            logger.error(f"Set preferred name error: {e}")
+            logger.error("Set preferred name error: %s", e)
             return False, str(e)
 
     def get_preferred_name(self, user_id: str) -> Optional[str]:
@@ -200,7 +331,7 @@ class SupabaseService:
             profile = self.get_user_profile(user_id)
             return profile.get('preferred_name') if profile else None
         except Exception as e:
-            logger.error(f"Get preferred name error: {e}")
+            logger.error("Get preferred name error: %s", e)
             return None
 
     # ==================== CONVERSATIONS ====================
@@ -211,7 +342,10 @@ class SupabaseService:
             # Use service role client for admin operations to bypass RLS
             metadata = conversation_data.get('metadata', {})
             
+            # The id is generated here, so the insert doesn't need to send the row back
+            conversation_id = str(uuid.uuid4())
             data = {
+                "id": conversation_id,
                 "user_id": user_id,
                 "user_message": conversation_data.get('message', ''),
                 "bot_response": conversation_data.get('response', ''),
@@ -223,36 +357,38 @@ class SupabaseService:
                 "metadata": metadata
             }
             
-            # Use admin client to bypass RLS for now
-            response = self.admin_client.table('conversations').insert(data).execute()
+            # Use admin client to bypass RLS for now; a failed insert raises
+            self.admin_client.table('conversations').insert(data, returning=ReturnMethod.minimal).execute()
             
-            if response.data and len(response.data) > 0:
-                conversation_id = response.data[0]['id']
-                
-                # Also save mood history
-                self.save_mood_history(user_id, {
+            # Also save mood history, in the background, when the turn carried a mood signal
+            if data['mood'] != 'neutral' and data['mood_confidence'] >= MOOD_HISTORY_MIN_CONFIDENCE:
+                self._mood_queue.put(self._mood_history_row(user_id, {
                     'mood': data['mood'],
                     'confidence': data['mood_confidence'],
                     'context': f"Conversation: {conversation_data.get('message', '')[:50]}..."
-                })
-                
-                return True, "Conversation saved", conversation_id
-            else:
-                return False, "Failed to save conversation", ""
-                
+                }))
+            
+            return True, "Conversation saved", conversation_id
+            
         except Exception as e:
-            logger.error(f"Save conversation error: {e}")
+            logger.error("Save conversation error: %s", e)
             return False, str(e), ""
 
-    def get_user_conversations(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """Get user's conversation history"""
+    def get_user_conversations(self, user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        """
+        Get user's conversation history, newest first.
+        Pass the created_at of the last conversation of a page as before to get the next
+        page; it seeks on (user_id, created_at) instead of skipping rows like an offset.
+        """
         try:
-            response = (self.supabase.table('conversations')
-                       .select("*")
-                       .eq('user_id', user_id)
-                       .order('created_at', desc=True)
-                       .limit(limit)
-                       .execute())
+            query = (self.supabase.table('conversations')
+                    .select(CONVERSATION_COLUMNS)
+                    .eq('user_id', user_id))
+            
+            if before:
+                query = query.lt('created_at', before)
+            
+            response = query.order('created_at', desc=True).limit(limit).execute()
             
             conversations = []
             for conv in response.data:
@@ -272,7 +408,7 @@ class SupabaseService:
             return conversations
             
         except Exception as e:
-            logger.error(f"Get conversations error: {e}")
+            logger.error("Get conversations error: %s", e)
             return []
 
     def delete_conversation(self, conversation_id: str, user_id: str) -> Tuple[bool, str]:
@@ -290,13 +426,16 @@ class SupabaseService:
                 return False, "Conversation not found or access denied"
                 
         except Exception as e:
-            logger.error(f"Delete conversation error: {e}")
+            logger.error("Delete conversation error: %s", e)
             return False, str(e)
 
     # ==================== USER MEMORIES ====================
     
     def save_user_memory(self, user_id: str, memory_type: str, memory_data: Dict) -> Tuple[bool, str]:
         """Save user memory matching enhanced schema structure"""
+        if not (memory_data.get('fact') or '').strip():
+            return False, "Memory has no fact to save"
+        
         try:
             data = {
                 "user_id": user_id,
@@ -317,42 +456,34 @@ class SupabaseService:
                 return False, "Failed to save memory"
                 
         except Exception as e:
-            logger.error(f"Save memory error: {e}")
+            logger.error("Save memory error: %s", e)
             return False, str(e)
 
     def search_user_memories(self, user_id: str, search_terms: List[str], memory_types: List[str] = None) -> List[Dict]:
         """Search user memories by keywords and types"""
+        if not search_terms:
+            return []
+        
         try:
             query = self.supabase.table('user_memories').select("*").eq('user_id', user_id)
             
             if memory_types:
                 query = query.in_('memory_type', memory_types)
             
-            response = query.order('importance_score', desc=True).limit(10).execute()
-            
-            if not response.data:
-                return []
+            # Case-insensitive substring match of any term against fact, name or category
+            patterns = [_ilike_pattern(term) for term in search_terms]
+            query = query.or_(','.join(
+                f'{column}.ilike.{pattern}'
+                for pattern in patterns
+                for column in ('fact', 'name', 'category')
+            ))
             
-            # Filter by search terms (simple text matching)
-            filtered_memories = []
-            for memory in response.data:
-                fact_lower = memory.get('fact', '').lower()
-                name_lower = (memory.get('name') or '').lower()
-                category_lower = (memory.get('category') or '').lower()
-                
-                # Check if any search term matches
-                for term in search_terms:
-                    term_lower = term.lower()
-                    if (term_lower in fact_lower or 
-                        term_lower in name_lower or 
-                        term_lower in category_lower):
-                        filtered_memories.append(memory)
-                        break
+            response = query.order('importance_score', desc=True).limit(5).execute()
             
-            return filtered_memories[:5]  # Return top 5 matches
+            return response.data if response.data else []  # Top 5 matches
             
         except Exception as e:
-            logger.error(f"Search memories error: {e}")
+            logger.error("Search memories error: %s", e)
             return []
 
     def get_memories_by_category(self, user_id: str, category: str, limit: int = 5) -> List[Dict]:
@@ -369,7 +500,7 @@ class SupabaseService:
             return response.data if response.data else []
             
         except Exception as e:
-            logger.error(f"Get memories by category error: {e}")
+            logger.error("Get memories by category error: %s", e)
             return []
 
     def get_user_memories(self, user_id: str, memory_type: str = None) -> List[Dict]:
@@ -385,7 +516,7 @@ class SupabaseService:
             return response.data if response.data else []
             
         except Exception as e:
-            logger.error(f"Get memories error: {e}")
+            logger.error("Get memories error: %s", e)
             return []
 
     def update_user_memory(self, memory_id: str, user_id: str, updates: Dict) -> Tuple[bool, str]:
@@ -403,7 +534,7 @@ class SupabaseService:
                 return False, "Memory not found or access denied"
                 
         except Exception as e:
-            logger.error(f"Update memory error: {e}")
+            logger.error("Update memory error: %s", e)
             return False, str(e)
 
     # ==================== MOOD HISTORY ====================
@@ -420,7 +551,7 @@ class SupabaseService:
                 return False, "Failed to create mood entry"
                 
         except Exception as e:
-            logger.error(f"Create mood entry error: {e}")
+            logger.error("Create mood entry error: %s", e)
             return False, str(e)
 
     def get_mood_entries(self, user_id: str, days: int = None, limit: int = 50) -> List[Dict]:
@@ -429,7 +560,6 @@ class SupabaseService:
             query = self.admin_client.table('mood_entries').select('*').eq('user_id', user_id)
             
             if days:
-                from datetime import datetime, timedelta
                 cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
                 query = query.gte('timestamp', cutoff_date)
             
@@ -437,7 +567,7 @@ class SupabaseService:
             return response.data if response.data else []
             
         except Exception as e:
-            logger.error(f"Get mood entries error: {e}")
+            logger.error("Get mood entries error: %s", e)
             return []
 
     def get_latest_mood_entry(self, user_id: str) -> Optional[Dict]:
@@ -448,12 +578,13 @@ class SupabaseService:
                        .eq('user_id', user_id)
                        .order('timestamp', desc=True)
                        .limit(1)
+                       .maybe_single()
                        .execute())
             
-            return response.data[0] if response.data else None
+            return response.data if response is not None else None
             
         except Exception as e:
-            logger.error(f"Get latest mood entry error: {e}")
+            logger.error("Get latest mood entry error: %s", e)
             return None
 
     def delete_mood_entry(self, entry_id: int, user_id: str) -> Tuple[bool, str]:
@@ -471,18 +602,13 @@ class SupabaseService:
                 return False, "Mood entry not found or access denied"
                 
         except Exception as e:
-            logger.error(f"Delete mood entry error: {e}")
+            logger.error("Delete mood entry error: %s", e)
             return False, str(e)
 
     def save_mood_history(self, user_id: str, mood_data: Dict) -> Tuple[bool, str]:
         """Save mood history entry"""
         try:
-            data = {
-                "user_id": user_id,
-                "mood": mood_data.get('mood', 'neutral'),
-                "confidence": mood_data.get('confidence', 0.0),
-                "context": mood_data.get('context', '')
-            }
+            data = self._mood_history_row(user_id, mood_data)
             
             # Use admin client to bypass RLS for mood history
             response = self.admin_client.table('mood_history').insert(data).execute()
@@ -493,9 +619,19 @@ class SupabaseService:
                 return False, "Failed to save mood history"
                 
         except Exception as e:
-            logger.error(f"Save mood history error: {e}")
+            logger.error("Save mood history error: %s", e)
             return False, str(e)
 
+    @staticmethod
+    def _mood_history_row(user_id: str, mood_data: Dict) -> Dict:
+        """mood_history insert row for a mood entry"""
+        return {
+            "user_id": user_id,
+            "mood": mood_data.get('mood', 'neutral'),
+            "confidence": mood_data.get('confidence', 0.0),
+            "context": mood_data.get('context', '')
+        }
+
     def get_mood_history(self, user_id: str, limit: int = 30) -> List[Dict]:
         """Get user's mood history"""
         try:
@@ -509,7 +645,7 @@ class SupabaseService:
             return response.data if response.data else []
             
         except Exception as e:
-            logger.error(f"Get mood history error: {e}")
+            logger.error("Get mood history error: %s", e)
             return []
 
     # ==================== ANALYTICS ====================
@@ -517,25 +653,12 @@ class SupabaseService:
     def get_user_stats(self, user_id: str) -> Dict:
         """Get user statistics"""
         try:
-            # Count conversations
-            conv_response = (self.supabase.table('conversations')
-                           .select("id", count="exact")
-                           .eq('user_id', user_id)
-                           .execute())
-            
-            conversation_count = conv_response.count if conv_response.count else 0
-            
-            # Get first conversation date
-            first_conv = (self.supabase.table('conversations')
-                         .select("created_at")
-                         .eq('user_id', user_id)
-                         .order('created_at', desc=False)
-                         .limit(1)
-                         .execute())
-            
-            first_conversation_date = None
-            if first_conv.data and len(first_conv.data) > 0:
-                first_conversation_date = first_conv.data[0]['created_at']
+            # Count and first conversation date in one query
+            response = self.supabase.rpc('get_user_stats', {'p_user_id': user_id}).execute()
+            row = response.data[0] if response.data else {}
+            
+            conversation_count = row.get('total_conversations') or 0
+            first_conversation_date = row.get('first_conversation')
             
             return {
                 "total_conversations": conversation_count,
@@ -544,7 +667,7 @@ class SupabaseService:
             }
             
         except Exception as e:
-            logger.error(f"Get stats error: {e}")
+            logger.error("Get stats error: %s", e)
             return {
                 "total_conversations": 0,
                 "first_conversation": None,
@@ -559,23 +682,28 @@ class SupabaseService:
             response = self.admin_client.table('profiles').select("*").execute()
             return response.data if response.data else []
         except Exception as e:
-            logger.error(f"Get all users error: {e}")
+            logger.error("Get all users error: %s", e)
             return []
 
     def delete_user_data(self, user_id: str) -> Tuple[bool, str]:
         """Delete all user data (admin function)"""
         try:
-            # Delete conversations
-            self.admin_client.table('conversations').delete().eq('user_id', user_id).execute()
-            
-            # Delete memories
-            self.admin_client.table('user_memories').delete().eq('user_id', user_id).execute()
-            
-            # Delete profile
-            self.admin_client.table('profiles').delete().eq('id', user_id).execute()
+            admin = self.admin_client
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # The profile doesn't depend on the other rows, so delete it alongside them
+                profile_delete = executor.submit(
+                    lambda: admin.table('profiles').delete().eq('id', user_id).execute()
+                )
+                
+                # Memories can reference conversations (source_conversation_id), so they go first
+                admin.table('user_memories').delete().eq('user_id', user_id).execute()
+                admin.table('conversations').delete().eq('user_id', user_id).execute()
+                
+                profile_delete.result()
+            self._forget_profile(user_id)
             
             return True, "User data deleted successfully"
             
         except Exception as e:
-            logger.error(f"Delete user data error: {e}")
+            logger.error("Delete user data error: %s", e)
             return False, str(e)
\ No newline at end of file
@@ -4,10 +4,30 @@ Converts your existing text-based Jumbo chatbot to speech-enabled
 Supports Telugu, Hindi, and English
 """
 
-import speech_recognition as sr
-import pyttsx3
+import atexit
+import hashlib
+import importlib.util
+import io
+import queue
 import sys
 import os
+import threading
+import time
+from collections import OrderedDict
+
+# speech_recognition, pyttsx3 and faster-whisper are imported by the voice classes that
+# use them, and VoiceChatbotManager creates those on the first voice turn, so PortAudio,
+# the TTS driver and the Whisper runtime are not loaded during startup and user setup
+
+# faster-whisper is optional; recognition falls back to Google Speech Recognition
+WHISPER_AVAILABLE = importlib.util.find_spec('faster_whisper') is not None
+
+try:
+    import simpleaudio
+    SIMPLEAUDIO_AVAILABLE = True
+except ImportError:
+    # simpleaudio is optional; without it every reply is synthesized live
+    SIMPLEAUDIO_AVAILABLE = False
 
 # Add your project to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -17,7 +37,6 @@ from chatbot import JumboChatbot
 from language_utils import Language
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ================== CONFIGURATION ==================
@@ -28,8 +47,21 @@ class VoiceConfig:
     TTS_RATE = 150  # Words per minute for text-to-speech
     TTS_VOLUME = 0.9  # Volume 0.0 to 1.0
     USE_FEMALE_VOICE = True
+    # Synthesized WAVs of repeated short replies live in the user's cache directory
+    TTS_CACHE_DIR = os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+        'jumbo', 'tts'
+    )
+    TTS_CACHE_MAX_FILES = 500  # Least recently played WAVs are removed past this
+    TTS_CACHE_MAX_CHARS = 200  # Longer (one-off LLM) replies are always spoken directly
+    TTS_SEEN_MAX = 2048  # Recent replies remembered to spot repeats
     TIMEOUT_SECONDS = 10
     PHRASE_TIME_LIMIT = 5
+    CALIBRATION_SECONDS = 1.0  # Ambient-noise calibration when the microphone opens
+    WHISPER_MODEL = 'small'  # Local faster-whisper model, used when installed
+    # int8 weights with fp32 activations; 'int8_bfloat16' is faster on CPUs with AVX512_BF16
+    WHISPER_COMPUTE_TYPE = 'int8_float32'
+    WHISPER_CPU_THREADS = max(1, (os.cpu_count() or 2) // 2)  # Leave cores for TTS and capture
 
 # ================== SPEECH RECOGNITION ==================
 
@@ -37,38 +69,92 @@ class VoiceChatbotInput:
     """Handle speech recognition with support for multiple languages"""
     
     def __init__(self):
+        import speech_recognition as sr
+        self._sr = sr
         self.recognizer = sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = True
+        # Opened once on the first voice turn and kept for the whole session
+        self.microphone = None
+        self.source = None
+        self.needs_calibration = True
         self.language_map = {
             'te': 'te-IN',  # Telugu
             'hi': 'hi-IN',  # Hindi
             'en': 'en-IN',  # English
         }
+        self.whisper_model = None  # Loaded on first use
+    
+    def _transcribe_local(self, audio, language_code):
+        """Transcribe with the local faster-whisper model"""
+        if self.whisper_model is None:
+            from faster_whisper import WhisperModel
+            self.whisper_model = WhisperModel(
+                VoiceConfig.WHISPER_MODEL,
+                device="cpu",
+                compute_type=VoiceConfig.WHISPER_COMPUTE_TYPE,
+                cpu_threads=VoiceConfig.WHISPER_CPU_THREADS
+            )
+        segments, _ = self.whisper_model.transcribe(
+            io.BytesIO(audio.get_wav_data()),
+            language=language_code.split('-')[0],
+            beam_size=1,
+            vad_filter=True
+        )
+        return "".join(segment.text for segment in segments).strip()
+    
+    def _open_source(self):
+        """Open the microphone stream (first call only) and calibrate if needed"""
+        if self.source is None:
+            self.microphone = self._sr.Microphone()
+            self.source = self.microphone.__enter__()
+            atexit.register(self.close)
+        
+        if self.needs_calibration:
+            self.recognizer.adjust_for_ambient_noise(
+                self.source, duration=VoiceConfig.CALIBRATION_SECONDS
+            )
+            self.needs_calibration = False
+        return self.source
+    
+    def close(self):
+        """Close the microphone stream"""
+        if self.source is not None:
+            self.microphone.__exit__(None, None, None)
+            self.microphone = None
+            self.source = None
+            self.needs_calibration = True
     
     def recognize_speech(self, language_code='en-IN'):
         """
         Capture and recognize speech from microphone
         Returns: transcribed text or None if error
         """
+        sr = self._sr
         try:
-            with sr.Microphone() as source:
-                print("\n🎤 Listening...")
-                
-                # Adjust for ambient noise
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                
-                # Capture audio with timeout
-                audio = self.recognizer.listen(
-                    source,
-                    timeout=VoiceConfig.TIMEOUT_SECONDS,
-                    phrase_time_limit=VoiceConfig.PHRASE_TIME_LIMIT
-                )
+            source = self._open_source()
+            print("\n🎤 Listening...")
             
-            # Recognize speech using Google Speech Recognition
-            print("⏳ Processing speech...")
-            text = self.recognizer.recognize_google(
-                audio,
-                language=language_code
+            # Capture audio with timeout
+            audio = self.recognizer.listen(
+                source,
+                timeout=VoiceConfig.TIMEOUT_SECONDS,
+                phrase_time_limit=VoiceConfig.PHRASE_TIME_LIMIT
             )
+            
+            print("⏳ Processing speech...")
+            text = None
+            if WHISPER_AVAILABLE:
+                try:
+                    text = self._transcribe_local(audio, language_code)
+                except Exception as e:
+                    logger.warning(f"Local speech recognition failed, using Google: {e}")
+            
+            if not text:
+                # Recognize speech using Google Speech Recognition
+                text = self.recognizer.recognize_google(
+                    audio,
+                    language=language_code
+                )
             print(f"👤 You: {text}")
             return text
             
@@ -78,6 +164,8 @@ class VoiceChatbotInput:
             return None
         except sr.UnknownValueError:
             print("❌ Could not understand the audio. Please speak clearly.")
+            # Background noise may have changed; recalibrate before the next turn
+            self.needs_calibration = True
             return None
         except sr.RequestError:
             print("❌ Could not reach speech recognition service.")
@@ -89,11 +177,107 @@ class VoiceChatbotInput:
 # ================== TEXT-TO-SPEECH ==================
 
 class VoiceChatbotOutput:
-    """Handle text-to-speech conversion"""
+    """Handle text-to-speech conversion on a background thread"""
     
     def __init__(self):
-        self.engine = pyttsx3.init()
-        self._configure_engine()
+        self.engine = None
+        self.queue = queue.Queue()
+        # Cache keys spoken once so far (worker thread only); a second occurrence is cached
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        # The engine is created on the worker thread; some pyttsx3 drivers must be
+        # driven from the thread that initialized them
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+    
+    def _worker(self):
+        """Speak queued text one reply at a time"""
+        try:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+            self._configure_engine()
+            # Keep the driver's event loop running for the session and pump it ourselves,
+            # instead of starting and stopping it with runAndWait for every reply
+            self.engine.startLoop(False)
+        except Exception as e:
+            logger.error(f"Could not start text-to-speech engine: {e}")
+            self.engine = None
+        
+        while True:
+            text = self.queue.get()
+            if text is None:  # Sent by close()
+                if self.engine is not None:
+                    self.engine.endLoop()
+                self.queue.task_done()
+                return
+            try:
+                if self.engine is not None:
+                    self._say(text)
+            except Exception as e:
+                print(f"❌ Text-to-Speech Error: {e}")
+                print(f"   (Fallback text): {text}")
+            finally:
+                self.queue.task_done()
+    
+    def _run_pending(self):
+        """Pump the engine loop until the queued utterance or file has finished"""
+        self.engine.iterate()
+        while self.engine.isBusy():
+            time.sleep(0.01)
+            self.engine.iterate()
+    
+    def _say(self, text):
+        """
+        Speak text, playing it from the WAV cache when it is a repeated short reply.
+        A reply is written to the cache on its second occurrence; first occurrences and
+        long replies are spoken directly so playback starts without a file round trip.
+        """
+        if not SIMPLEAUDIO_AVAILABLE or len(text) > VoiceConfig.TTS_CACHE_MAX_CHARS:
+            self.engine.say(text)
+            self._run_pending()
+            return
+        
+        key = f"{text}|{self.engine.getProperty('voice')}|{VoiceConfig.TTS_RATE}"
+        path = os.path.join(
+            VoiceConfig.TTS_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.wav'
+        )
+        cached = os.path.exists(path)
+        if not cached and key not in self._seen:
+            # First occurrence: remember it and speak directly
+            self._seen[key] = None
+            if len(self._seen) > VoiceConfig.TTS_SEEN_MAX:
+                self._seen.popitem(last=False)
+            self.engine.say(text)
+            self._run_pending()
+            return
+        
+        try:
+            if cached:
+                os.utime(path)  # Mark as recently played for eviction
+            else:
+                del self._seen[key]
+                os.makedirs(VoiceConfig.TTS_CACHE_DIR, exist_ok=True)
+                self.engine.save_to_file(text, path)
+                self._run_pending()
+                self._trim_cache()
+            simpleaudio.WaveObject.from_wave_file(path).play().wait_done()
+        except Exception as e:
+            # Some drivers don't write WAV; drop the file and speak directly
+            logger.warning(f"Cached speech playback failed, speaking directly: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            self.engine.say(text)
+            self._run_pending()
+    
+    def _trim_cache(self):
+        """Remove the least recently played WAVs beyond TTS_CACHE_MAX_FILES"""
+        paths = [os.path.join(VoiceConfig.TTS_CACHE_DIR, name)
+                 for name in os.listdir(VoiceConfig.TTS_CACHE_DIR)]
+        if len(paths) <= VoiceConfig.TTS_CACHE_MAX_FILES:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - VoiceConfig.TTS_CACHE_MAX_FILES]:
+            os.remove(path)
     
     def _configure_engine(self):
         """Configure text-to-speech engine"""
@@ -118,28 +302,58 @@ class VoiceChatbotOutput:
             logger.warning(f"Could not configure voice: {e}")
     
     def speak(self, text):
-        """Convert text to speech"""
-        try:
-            print(f"🤖 Bot: {text}\n")
-            self.engine.say(text)
-            self.engine.runAndWait()
-        except Exception as e:
-            print(f"❌ Text-to-Speech Error: {e}")
-            print(f"   (Fallback text): {text}")
+        """Queue text for speech and return without waiting for playback"""
+        print(f"🤖 Bot: {text}\n")
+        self.queue.put(text)
+    
+    def wait_idle(self):
+        """Block until everything queued so far has been spoken"""
+        self.queue.join()
+    
+    def close(self):
+        """Finish queued speech and stop the engine loop"""
+        if self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join(timeout=5)
+    
+    def speak_stream(self, sentences):
+        """Speak sentences as they arrive from an iterator; returns the full text"""
+        spoken = []
+        for sentence in sentences:
+            spoken.append(sentence)
+            self.speak(sentence)
+        return " ".join(spoken)
 
 # ================== JUMBO CHATBOT INTERFACE ==================
 
+EXIT_WORDS = frozenset({'exit', 'quit', 'bye', 'goodbye'})
+
 class VoiceChatbotManager:
     """Manage the voice-enabled Jumbo chatbot"""
     
     def __init__(self):
         self.chatbot = JumboChatbot()
-        self.voice_input = VoiceChatbotInput()
-        self.voice_output = VoiceChatbotOutput()
+        # Speech input/output are created on first use (see the properties below)
+        self._voice_input = None
+        self._voice_output = None
         self.current_user = None
         self.current_language = Language.ENGLISH
         self.text_mode = False
     
+    @property
+    def voice_input(self):
+        """Speech recognizer, created on the first voice turn"""
+        if self._voice_input is None:
+            self._voice_input = VoiceChatbotInput()
+        return self._voice_input
+    
+    @property
+    def voice_output(self):
+        """Text-to-speech worker, created on the first voice turn"""
+        if self._voice_output is None:
+            self._voice_output = VoiceChatbotOutput()
+        return self._voice_output
+    
     def setup_user(self):
         """Register or select a user"""
         print("\n" + "="*60)
@@ -197,6 +411,10 @@ class VoiceChatbotManager:
             'en-IN'
         )
         
+        # The microphone stays open, so let the previous reply finish playing first;
+        # otherwise Jumbo's own voice is recorded (and calibrated against) as user input
+        self.voice_output.wait_idle()
+        
         # Get user input via speech
         user_input = self.voice_input.recognize_speech(language_code)
         
@@ -205,11 +423,14 @@ class VoiceChatbotManager:
             return True
         
         # Check for mode switches
-        if user_input.lower() in ['exit', 'quit', 'bye', 'goodbye']:
+        command = user_input.lower()
+        if command in EXIT_WORDS:
             print("\n👋 Goodbye!")
+            self.voice_output.wait_idle()
             return False
         
-        if user_input.lower() == 'text mode':
+        if command == 'text mode':
+            self.voice_output.wait_idle()
             self.text_mode = True
             print("\n📝 Switched to text mode. Say 'voice mode' to switch back.")
             return True
@@ -239,11 +460,12 @@ class VoiceChatbotManager:
             return True
         
         # Check for mode switches
-        if user_input.lower() in ['exit', 'quit', 'bye', 'goodbye']:
+        command = user_input.lower()
+        if command in EXIT_WORDS:
             print("\n👋 Goodbye!")
             return False
         
-        if user_input.lower() == 'voice mode':
+        if command == 'voice mode':
             self.text_mode = False
             print("\n🎤 Switched to voice mode.")
             return True
@@ -323,9 +545,9 @@ def check_dependencies():
     
     missing = []
     for import_name, display_name in required.items():
-        try:
-            __import__(import_name)
-        except ImportError:
+        # Locate the package without importing it (importing speech_recognition
+        # and pyttsx3 would initialize PortAudio and the TTS driver up front)
+        if importlib.util.find_spec(import_name) is None:
             missing.append(display_name)
     
     if missing:
@@ -340,6 +562,7 @@ def check_dependencies():
 
 def main():
     """Main entry point"""
+    logging.basicConfig(handlers=[logging.StreamHandler()], level=logging.WARNING)
     print("\n🚀 Starting Jumbo Voice Chatbot...\n")
     
     # Check dependencies